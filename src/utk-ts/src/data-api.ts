@@ -50,31 +50,54 @@ export abstract class DataApi {
 
     const base_feature = <ILayerData> await DataLoader.getJsonData(url_base);
 
+    // layers saved with packed=True only have a .utkpack file
+    if(base_feature == null){
+      return await DataApi.getPackedLayer(layerId);
+    }
+
     let coordinates;
     let indices;
     let normals;
     let ids;
 
+    // compressed layers store each sidecar as chunks in a .zdata file (see DataLoader.getCompressedData)
+    const loadElement = async (url: string, type: string) => {
+      if(base_feature.compression != undefined){
+        return await DataLoader.getCompressedData(url.replace(/\.data$/, '.zdata'));
+      }
+
+      return await DataLoader.getBinaryData(url, type);
+    }
+
     if(base_feature.data != undefined){
 
       if(base_feature.data[0].geometry.coordinates != undefined){
         console.log(url_coordinates);
-        coordinates = <Float64Array> await DataLoader.getBinaryData(url_coordinates, 'd');
+        if(base_feature.origin != undefined){
+          // float32 offsets from the origin of the layer
+          const offsets = <Float32Array> await loadElement(url_coordinates, 'f');
+          coordinates = new Float64Array(offsets.length);
+          for(let i = 0; i < offsets.length; i++){
+            coordinates[i] = offsets[i] + base_feature.origin[i % base_feature.origin.length];
+          }
+        }else{
+          coordinates = <Float64Array> await loadElement(url_coordinates, 'd');
+        }
       }
 
       if(base_feature.data[0].geometry.indices != undefined){
         console.log(url_indices);
-        indices = <Uint32Array> await DataLoader.getBinaryData(url_indices, 'I');
+        indices = <Uint32Array> await loadElement(url_indices, 'I');
       }
 
       if(base_feature.data[0].geometry.normals != undefined){
         console.log(url_normals);
-        normals = <Float32Array> await DataLoader.getBinaryData(url_normals, 'f');
+        normals = <Float32Array> await loadElement(url_normals, 'f');
       }
 
       if(base_feature.data[0].geometry.ids != undefined){
         console.log(url_ids);
-        ids = <Uint32Array> await DataLoader.getBinaryData(url_ids, 'I');
+        ids = <Uint32Array> await loadElement(url_ids, 'I');
       }
 
       for(let i = 0; i < base_feature.data.length; i++){
@@ -106,6 +129,68 @@ export abstract class DataApi {
     return base_feature;
   }
 
+  /**
+   * Gets a packed layer (.utkpack): a prefix (magic, version, reserved, header position, header size), the binary sections of the
+   * geometry elements, the feature offset table ((features+1, elements) with the start of every feature in each section) and a json header
+   * @param {string} layerId the layer data
+   */
+  static async getPackedLayer(layerId: string): Promise<ILayerData> {
+    const url = `${Environment.backend}/files/${layerId}.utkpack`;
+    console.log(url);
+
+    const buffer = <ArrayBuffer> await DataLoader.getArrayBufferData(url);
+    const view = new DataView(buffer);
+
+    if(new TextDecoder().decode(new Uint8Array(buffer, 0, 7)) != 'UTKPACK')
+      throw Error(url+" is not a packed layer");
+
+    const header_offset = Number(view.getBigUint64(16, true));
+    const header_size = Number(view.getBigUint64(24, true));
+
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, header_offset, header_size)));
+
+    const layer = <ILayerData> header.layer;
+    const count = <number> header.count;
+    const elements = <string[]> header.elements;
+
+    const features = header.features != null ? header.features : Array.from({length: count}, () => ({geometry: {}}));
+
+    // start of feature i in the section of element j
+    const tableOffset = header.table.offset;
+    const tableStart = (i: number, j: number) => {
+      const position = tableOffset + (i*elements.length + j) * (header.table.type == '<u8' ? 8 : 4);
+      return header.table.type == '<u8' ? Number(view.getBigUint64(position, true)) : view.getUint32(position, true);
+    };
+
+    for(let j = 0; j < elements.length; j++){
+      const section = header.sections[elements[j]];
+
+      let values: Float32Array | Float64Array | Uint32Array | number[];
+
+      if(section.type == 'd'){
+        values = new Float64Array(buffer, section.offset, section.count);
+      }else if(section.type == 'f'){
+        values = new Float32Array(buffer, section.offset, section.count);
+      }else{
+        values = new Uint32Array(buffer, section.offset, section.count);
+      }
+
+      if(elements[j] == 'coordinates' && layer.origin != undefined){
+        // float32 offsets from the origin of the layer
+        const origin = layer.origin;
+        values = Array.from(<ArrayLike<number>> values, (value, i) => value + origin[i % origin.length]);
+      }
+
+      for(let i = 0; i < count; i++){
+        features[i].geometry[elements[j]] = Array.from(values.slice(tableStart(i, j), tableStart(i+1, j)));
+      }
+    }
+
+    layer.data = features;
+
+    return layer;
+  }
+
 
   /**
    * Gets the layer data
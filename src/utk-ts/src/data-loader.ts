@@ -124,6 +124,90 @@ export abstract class DataLoader {
     return null;
   }
 
+  /**
+   * Loads a whole binary file
+   * @param {string} url file url
+   * @returns {Promise<unknown>} The ArrayBuffer with the content of the file
+   */
+  static async getArrayBufferData(url: string): Promise<unknown> {
+
+    const response = await fetch(url);
+
+    if(!response.ok)
+      throw Error("Loading binary data failed");
+
+    return await response.arrayBuffer();
+  }
+
+  /**
+   * Loads a compressed sidecar (.zdata): a prefix (magic, version, codec, type of the values, values per chunk, number of values,
+   * number of chunks, position of the chunk index), the chunks compressed independently and the position of every chunk.
+   * Only zlib chunks can be decompressed in the browser
+   * @param {string} url zdata file url
+   * @returns {Promise<unknown>} The typed array with all values of the sidecar
+   */
+  static async getCompressedData(url: string): Promise<unknown> {
+
+    const response = await fetch(url);
+
+    if(!response.ok)
+      throw Error("Loading compressed data failed");
+
+    const buffer = await response.arrayBuffer();
+    const view = new DataView(buffer);
+
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 8));
+
+    if(magic != 'UTKZDATA')
+      throw Error(url+" is not a compressed sidecar");
+
+    const codec = view.getUint8(12);
+    const type = String.fromCharCode(view.getUint8(13));
+    const count = Number(view.getBigUint64(24, true));
+    const chunks = Number(view.getBigUint64(32, true));
+    const indexPosition = Number(view.getBigUint64(40, true));
+
+    if(codec != 1)
+      throw Error(url+" is compressed with lzma, which cannot be decompressed in the browser. Save the layer with compression='zlib' or without compression");
+
+    const values = new Uint8Array(count * DataLoader.typeSize(type));
+    let offset = 0;
+
+    for(let i = 0; i < chunks; i++){
+      const start = Number(view.getBigUint64(indexPosition + 8*i, true));
+      const end = Number(view.getBigUint64(indexPosition + 8*(i+1), true));
+
+      // 'deflate' streams are zlib streams (RFC 1950), the format written by zlib.compress
+      const stream = new Blob([buffer.slice(start, end)]).stream().pipeThrough(new DecompressionStream('deflate'));
+      const chunk = new Uint8Array(await new Response(stream).arrayBuffer());
+
+      values.set(chunk, offset);
+      offset += chunk.length;
+    }
+
+    if(type == 'f'){
+      return new Float32Array(values.buffer);
+    }
+
+    if(type == 'd'){
+      return new Float64Array(values.buffer);
+    }
+
+    if(type == 'I'){
+      return new Uint32Array(values.buffer);
+    }
+
+    return null;
+  }
+
+  /**
+   * Size in bytes of the values of a sidecar type
+   * @param {string} type f, d or I
+   */
+  static typeSize(type: string): number {
+    return type == 'd' ? 8 : 4;
+  }
+
   /**
    * Loads a text file
    * @param {string} url text file url
@@ -111,6 +111,8 @@ export interface ILayerData {
     styleKey: keyof IMapStyle;   // layer style key
     data?: ILayerFeature[];      // list of features of the layer 
     renderStyle?: RenderStyle[]; // list of render styles
+    origin?: number[];           // origin of the layer when coordinates are stored as float32 offsets
+    compression?: string;        // codec of the compressed sidecars (.zdata)
 }
 
 export interface IJoinedJson {
@@ -0,0 +1,201 @@
+import numpy as np
+import geopandas as gpd
+
+from shapely.ops import unary_union
+from shapely.geometry import Polygon, MultiPolygon, MultiPoint, box
+from shapely import affinity
+
+'''
+    Analytic shadows of extruded footprints (2.5D buildings such as the ones generated by Buildings.create_building_mesh).
+
+    A prism with footprint P between min_height and height casts on a horizontal plane at elevation z the Minkowski sum of P with the segment
+    swept by the sun offset between max(min_height, z) and height. Only horizontal surfaces (ground and roofs) are considered.
+'''
+
+'''
+    Levels with at least this many cells (e.g. the ground) are intersected with the union of the shadows of all blocks.
+    Smaller levels (roofs) are intersected only with the shadows of the blocks that can reach each cell
+'''
+UNION_LEVEL_SIZE = 32
+
+def _rings(geometry):
+    if(isinstance(geometry, MultiPolygon)):
+        polygons = list(geometry.geoms)
+    else:
+        polygons = [geometry]
+
+    rings = []
+    for polygon in polygons:
+        rings.append(np.asarray(polygon.exterior.coords)[:, :2])
+        for interior in polygon.interiors:
+            rings.append(np.asarray(interior.coords)[:, :2])
+
+    return rings
+
+def prism_shadow(footprint, min_height, height, level, shadow_vector, rings=None, convex=None):
+    '''
+        Shadow of a prism on the horizontal plane at elevation level
+
+        * @param {Polygon} footprint Footprint of the prism
+        * @param {float} min_height Elevation of the bottom of the prism
+        * @param {float} height Elevation of the top of the prism
+        * @param {float} level Elevation of the plane receiving the shadow
+        * @param {np.ndarray} shadow_vector Horizontal displacement of the shadow per meter of height (-direction_xy/direction_z)
+        * @param {List[np.ndarray]} rings Coordinates of the rings of the footprint. Computed if None
+        * @param {bool} convex If the footprint is convex. Computed if None
+        * @returns {Polygon} Shadow polygon (empty if the prism is below the plane)
+    '''
+
+    if(height <= level):
+        return Polygon()
+
+    if(rings == None):
+        rings = _rings(footprint)
+
+    if(convex == None):
+        convex = _is_convex(footprint)
+
+    start = shadow_vector * (max(min_height, level) - level)
+    end = shadow_vector * (height - level)
+
+    # the sweep of a convex polygon is the convex hull of its two ends
+    if(convex):
+        return MultiPoint(np.concatenate((rings[0]+start, rings[0]+end))).convex_hull
+
+    parts = [affinity.translate(footprint, start[0], start[1]), affinity.translate(footprint, end[0], end[1])]
+
+    # area swept by each edge of the footprint
+    for ring in rings:
+        a = ring[:-1]
+        b = ring[1:]
+        quads = np.stack((a+start, b+start, b+end, a+end), axis=1)
+        parts += [Polygon(quad) for quad in quads]
+
+    return unary_union(parts)
+
+def _is_convex(footprint):
+    return isinstance(footprint, Polygon) and len(footprint.interiors) == 0 and footprint.convex_hull.area - footprint.area <= 1e-9 * max(footprint.area, 1)
+
+def _shadowed_area(cells, shadow):
+    '''
+        Area of each cell covered by shadow. The shadow is split in its disjoint polygons indexed with an STRtree
+    '''
+
+    area = np.zeros(len(cells))
+
+    if(shadow.is_empty):
+        return area
+
+    parts = gpd.GeoSeries(list(shadow.geoms) if hasattr(shadow, 'geoms') else [shadow])
+
+    cell_index, part_index = parts.sindex.query_bulk(cells.values, predicate='intersects')
+
+    if(len(cell_index) == 0):
+        return area
+
+    intersections = cells.take(cell_index).reset_index(drop=True).intersection(parts.take(part_index).reset_index(drop=True))
+
+    return np.bincount(cell_index, weights=intersections.area.values, minlength=len(cells))
+
+def analytic_shadow(buildings, cells, directions, height_column='height', min_height_column='min_height', cell_height_column='height'):
+    '''
+        Fraction of the area of each surface cell in shadow for each sun direction, computed by projecting the building footprints
+        along the sun vector and unioning the shadow polygons. Cheaper than ray tracing the triangle mesh of the buildings.
+
+        Only prisms taller than the elevation of a cell shade it, and only prisms close enough to reach it are projected (STRtree queries).
+        Directions below the horizon leave every cell unshaded, as vertices facing away from the sun in ShadowAccumulator.
+
+        * @param {GeoDataFrame} buildings Footprints (Polygon or MultiPolygon) with the height and min_height of each block
+        * @param {GeoDataFrame} cells Horizontal surface cells (ground or roof polygons) with their elevation. Cells without elevation are on the ground
+        * @param {List[List[float]]} directions Unit vectors pointing to the sun (see ShadowAccumulator.compute_directions)
+        * @param {string} height_column Column of buildings with the elevation of the top of each block
+        * @param {string} min_height_column Column of buildings with the elevation of the bottom of each block. If missing blocks start on the ground
+        * @param {string} cell_height_column Column of cells with the elevation of each cell
+        * @returns {np.ndarray} (cells, directions) float32 array with the shadowed fraction of each cell
+    '''
+
+    if(buildings.crs != None):
+        buildings = buildings.to_crs('epsg:3395')
+
+    if(cells.crs != None):
+        cells = cells.to_crs('epsg:3395')
+
+    footprints = buildings.geometry.reset_index(drop=True)
+    heights = buildings[height_column].to_numpy(dtype=np.float64)
+    min_heights = buildings[min_height_column].to_numpy(dtype=np.float64) if min_height_column in buildings else np.zeros(len(buildings))
+
+    cell_geometries = cells.geometry.reset_index(drop=True)
+    cell_heights = cells[cell_height_column].to_numpy(dtype=np.float64) if cell_height_column in cells else np.zeros(len(cells))
+    cell_areas = cell_geometries.area.values
+    cell_bounds = cell_geometries.bounds.values
+
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+
+    fractions = np.zeros((len(cells), len(directions)), dtype=np.float32)
+
+    if(len(cells) == 0 or len(buildings) == 0):
+        return fractions
+
+    shapes = list(footprints)
+    rings = [_rings(footprint) for footprint in shapes]
+    convex = [_is_convex(footprint) for footprint in shapes]
+    top = heights.max()
+
+    def shadow(i, level, shadow_vector):
+        return prism_shadow(shapes[i], min_heights[i], heights[i], level, shadow_vector, rings[i], convex[i])
+
+    levels, level_sizes = np.unique(cell_heights, return_counts=True)
+    union_levels = levels[level_sizes >= UNION_LEVEL_SIZE]
+    single_cells = np.nonzero(~np.isin(cell_heights, union_levels))[0]
+
+    for d, direction in enumerate(directions):
+
+        if(direction[2] <= 0):
+            continue
+
+        shadow_vector = -direction[:2] / direction[2]
+        reach = np.linalg.norm(shadow_vector)
+
+        for level in union_levels:
+            level_cells = np.nonzero(cell_heights == level)[0]
+
+            # blocks that are taller than the level and whose shadow can reach its cells
+            minx, miny = cell_bounds[level_cells, :2].min(axis=0)
+            maxx, maxy = cell_bounds[level_cells, 2:].max(axis=0)
+            distance = reach * (top - level)
+
+            candidates = footprints.sindex.query(box(minx-distance, miny-distance, maxx+distance, maxy+distance))
+            candidates = candidates[heights[candidates] > level]
+
+            if(len(candidates) == 0):
+                continue
+
+            area = _shadowed_area(cell_geometries.take(level_cells).reset_index(drop=True), unary_union([shadow(i, level, shadow_vector) for i in candidates]))
+
+            fractions[level_cells, d] = np.divide(area, cell_areas[level_cells], out=np.zeros(len(level_cells)), where=cell_areas[level_cells] > 0)
+
+        if(len(single_cells) == 0):
+            continue
+
+        # the other cells only project the blocks that can reach them
+        distances = reach * np.maximum(top - cell_heights[single_cells], 0)
+        bounds = cell_bounds[single_cells]
+        search = [box(b[0]-r, b[1]-r, b[2]+r, b[3]+r) for b, r in zip(bounds, distances)]
+
+        cell_index, candidates = footprints.sindex.query_bulk(search)
+        taller = heights[candidates] > cell_heights[single_cells[cell_index]]
+        cell_index, candidates = cell_index[taller], candidates[taller]
+
+        for position in np.unique(cell_index):
+            cell = single_cells[position]
+            level = cell_heights[cell]
+
+            blocks = candidates[cell_index == position]
+            shade = unary_union([shadow(i, level, shadow_vector) for i in blocks])
+
+            if(cell_areas[cell] > 0):
+                fractions[cell, d] = shade.intersection(cell_geometries.iloc[cell]).area / cell_areas[cell]
+
+    np.clip(fractions, 0, 1, out=fractions)
+
+    return fractions
@@ -751,9 +751,9 @@ class Buildings:
 
             coords_all, indices_all, ids_all, _, normals = Buildings.get_coordinates(df.iloc[[index]], compute_normals=True) # Calculating normals
 
-            flattened_coordinates += [round(item,4) for sublist in coords_all for item in sublist]
-            flattened_indices += [int(item) for sublist in indices_all for item in sublist]
-            flattened_normals += [round(float(item),4) for sublist in normals for item in sublist]
+            flattened_coordinates += np.round(coords_all, 4).ravel().tolist()
+            flattened_indices += indices_all.astype(int).ravel().tolist()
+            flattened_normals += np.round(np.asarray(normals, dtype=np.float64), 4).ravel().tolist()
 
             # json_new["data"].append({
             #     "geometry": {
@@ -776,9 +776,9 @@ class Buildings:
                     "coordinates": flattened_coordinates,
                     "indices": flattened_indices,
                     "normals": flattened_normals,
-                    "ids": [int(elem) for elem in ids_all],
-                    "orientedEnvelope": [[round(elem,4) for elem in item] for item in df.iloc[[index]]["orientedEnvelope"].tolist()[0]],
-                    "sectionFootprint": [[round(elem,4) for elem in item] for item in df.iloc[[index]]["sectionFootprint"].tolist()[0]]
+                    "ids": ids_all.astype(int).tolist(),
+                    "orientedEnvelope": [np.round(item, 4).tolist() for item in df.iloc[[index]]["orientedEnvelope"].tolist()[0]],
+                    "sectionFootprint": [np.round(item, 4).tolist() for item in df.iloc[[index]]["sectionFootprint"].tolist()[0]]
                 }
             })
 
@@ -3,9 +3,10 @@ from .load_utk import *
 from .utils import *
 from .load_physical import *
 from .load_thematic import *
+from .analytic_shadow import analytic_shadow, prism_shadow
 
 try:
-    # Avoid importing it in systems without optix
+    # Avoid failing when the shadow dependencies (pysolar, timezonefinder) are not installed
     from .shadow_accumulator import *
 except:
     import warnings
@@ -15,7 +16,7 @@ except:
 
 # exposes simulations like .shadow
 # loads any kind of data the type is determined by the extension
-def shadow(filespaths, intervals):
+def shadow(filespaths, intervals, backend=None, backend_options=None, visibility=None, previous=None, changed=None, workers=None, tile_size=None, min_altitude=None, cell_samples=None, angular_tolerance=None):
 
     coordinates = []
 
@@ -33,7 +34,7 @@ def shadow(filespaths, intervals):
 
     centroid = convert_projections('3395', '4326', [(min(longitudes) + max(longitudes))/2, (min(latitudes) + max(latitudes))/2])
 
-    shadowAccumulator = ShadowAccumulator(centroid[1], centroid[0], filespaths, intervals)
-    shadowAccumulator.accumulate_shadow()
+    shadowAccumulator = ShadowAccumulator(centroid[1], centroid[0], filespaths, intervals, backend, backend_options, visibility, workers, tile_size, min_altitude, cell_samples, angular_tolerance)
+    shadowAccumulator.accumulate_shadow(previous, changed)
 
     return shadowAccumulator
\ No newline at end of file
@@ -3,11 +3,13 @@ import geopandas as gpd
 import pandas as pd
 import numpy as np
 import os
-import struct
 
 from shapely.geometry import Polygon, Point
 from scipy.spatial import KDTree
 
+from .layer_view import open_layer
+from .layer_io import read_abstract_layer
+
 class FilesInterface:
     """
     Basic Urban Toolkit component
@@ -89,15 +91,15 @@ class FilesInterface:
                     ids.append(id)
                     geometries.append(Polygon(groupedCoordinates))
         else:
-            for i in range(0,int(len(layer_json['coordinates'])/dimensions)):
-                
-                values_coordinates.append(layer_json['values'][i])
-                geometries_coordinates.append(Point(layer_json['coordinates'][i*dimensions], layer_json['coordinates'][i*dimensions+1]))
+            abstract_coordinates = np.asarray(layer_json['coordinates'], dtype=np.float64)
+            abstract_coordinates = abstract_coordinates[:len(abstract_coordinates)//dimensions*dimensions].reshape(-1, dimensions)
+
+            values_coordinates = np.asarray(layer_json['values'])[:len(abstract_coordinates)].tolist()
+            geometries_coordinates = gpd.points_from_xy(abstract_coordinates[:,0], abstract_coordinates[:,1])
 
-                if(dimensions == 3):
-                    tridimensional_coordinates.append([layer_json['coordinates'][i*dimensions], layer_json['coordinates'][i*dimensions+1], layer_json['coordinates'][i*dimensions+2]])
-                    ids_tridimensional_coordinates.append(counter_id_tridimensional_coordinates)        
-                    counter_id_tridimensional_coordinates += 1  
+            if(dimensions == 3):
+                tridimensional_coordinates = abstract_coordinates.tolist()
+                ids_tridimensional_coordinates = list(range(len(abstract_coordinates)))
 
         gdf = gpd.GeoDataFrame({'geometry': geometries, 'id': ids}, crs=3395) if not abstract else {}
 
@@ -116,85 +118,10 @@ class FilesInterface:
         layer_json = []
         layer_gdf = gdf
 
-        coordinates = []
-        normals = []
-        indices = []
-        ids = []
-
-        with open(json_pathfile, "r", encoding="utf-8") as f:
-            layer_json = json.load(f)
-
         if(not abstract):
-
-            directory = os.path.dirname(json_pathfile)
-
-            # file name with extension
-            file_name = os.path.basename(json_pathfile)
-            # file name without extension
-            file_name_wo_extension = os.path.splitext(file_name)[0]
-
-            if('coordinates' in layer_json['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_coordinates.data'), "rb")
-
-                data = f.read()
-
-                unpacked_data = struct.iter_unpack('d', data)
-
-                for elem in unpacked_data:
-                    coordinates.append(elem[0])
-
-                f.close()
-            if('normals' in layer_json['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_normals.data'), "rb")
-
-                data = f.read()
-
-                unpacked_data = struct.iter_unpack('f', data)
-
-                for elem in unpacked_data:
-                    normals.append(elem[0])
-
-                f.close()
-            if('indices' in layer_json['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_indices.data'), "rb")
-
-                data = f.read()
-
-                unpacked_data = struct.iter_unpack('I', data)
-
-                for elem in unpacked_data:
-                    indices.append(elem[0])
-
-                f.close()
-            if('ids' in layer_json['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_ids.data'), "rb")
-
-                data = f.read()
-
-                unpacked_data = struct.iter_unpack('I', data)
-
-                for elem in unpacked_data:
-                    ids.append(elem[0])
-
-                f.close()
-
-            for i in range(len(layer_json['data'])):
-
-                if(len(coordinates) > 0):
-                    startAndSize = layer_json['data'][i]['geometry']['coordinates']
-                    layer_json['data'][i]['geometry']['coordinates'] = coordinates[startAndSize[0]:startAndSize[0]+startAndSize[1]]
-
-                if(len(indices) > 0):
-                    startAndSize = layer_json['data'][i]['geometry']['indices']
-                    layer_json['data'][i]['geometry']['indices'] = indices[startAndSize[0]:startAndSize[0]+startAndSize[1]]
-
-                if(len(normals) > 0):
-                    startAndSize = layer_json['data'][i]['geometry']['normals']
-                    layer_json['data'][i]['geometry']['normals'] = normals[startAndSize[0]:startAndSize[0]+startAndSize[1]]
-
-                if(len(ids) > 0):
-                    startAndSize = layer_json['data'][i]['geometry']['ids']
-                    layer_json['data'][i]['geometry']['ids'] = ids[startAndSize[0]:startAndSize[0]+startAndSize[1]]
+            layer_json = open_layer(json_pathfile).to_json()
+        else:
+            layer_json = read_abstract_layer(json_pathfile)
 
         if(layer_gdf == None):
             layer_gdf = self.jsonToGdf(layer_json, None, abstract)
@@ -0,0 +1,736 @@
+import os
+import json
+import struct
+import zlib
+import lzma
+import numpy as np
+
+'''
+    Binary sidecars (.data files) storing the geometry of physical layers and the type of their elements
+'''
+SIDECAR_TYPES = {
+    'coordinates': 'd',
+    'normals': 'f',
+    'indices': 'I',
+    'ids': 'I'
+}
+
+def sidecar_path(directory, layer_name, element):
+    return os.path.join(directory, layer_name+'_'+element+'.data')
+
+def read_sidecar(directory, layer_name, element, dtype=None):
+    '''
+        Memory-maps the sidecar of a layer element. Nothing is read from disk until the array is accessed.
+
+        * @param {string} directory Folder where the layer is stored
+        * @param {string} layer_name Name of the layer (file name without extension)
+        * @param {string} element One of: coordinates, normals, indices, ids
+        * @param {string} dtype Type of the stored values. If None the default type of the element is used
+        * @returns {np.ndarray} Flat read-only array with all values of the element
+    '''
+
+    if(dtype == None):
+        dtype = SIDECAR_TYPES[element]
+
+    path = sidecar_path(directory, layer_name, element)
+
+    if(os.path.getsize(path) == 0): # mmap does not support empty files
+        return np.empty(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode='r')
+
+'''
+    Number of values buffered before they are flushed to a sidecar
+'''
+WRITE_CHUNK_SIZE = 1 << 20
+
+def write_sidecar(directory, layer_name, element, data, dtype=None, compression=None, origin=None, reduce=None):
+    '''
+        Streams the element of every feature into its sidecar and replaces it by the [start, size] pair of the feature.
+
+        Features are buffered until WRITE_CHUNK_SIZE values are collected, so peak memory is bounded by the chunk (or the largest feature) and not by the whole layer.
+        The file is written under a temporary name and then moved, so arrays still mapping the previous version of the sidecar remain valid.
+
+        * @param {string} directory Folder where the layer is stored
+        * @param {string} layer_name Name of the layer (file name without extension)
+        * @param {string} element One of: coordinates, normals, indices, ids
+        * @param {List} data Features of the layer
+        * @param {string} dtype Type of the stored values. If None the default type of the element is used
+        * @param {string} compression Codec used to compress the sidecar in chunks (see SIDECAR_CODECS). If None the values are stored raw
+        * @param {List[float]} origin If provided the values are stored as float32 offsets from origin (see compute_origin)
+        * @param {Function} reduce Called with every chunk of stored values and the sizes of its features (see _stream_values)
+    '''
+
+    if(dtype == None):
+        dtype = SIDECAR_TYPES[element]
+
+    transform = None
+
+    if(origin != None):
+        dtype = LOCAL_COORDINATES_TYPE
+        transform = lambda values: to_local_origin(values, origin)
+
+    if(compression == None):
+        path = sidecar_path(directory, layer_name, element)
+        stale = compressed_sidecar_path(directory, layer_name, element)
+
+        with open(path+'.tmp', 'wb') as fout:
+            sizes = _stream_values(lambda values: values.tofile(fout), data, element, dtype, transform, reduce)
+    else:
+        path = compressed_sidecar_path(directory, layer_name, element)
+        stale = sidecar_path(directory, layer_name, element)
+
+        with open(path+'.tmp', 'wb') as fout:
+            writer = _CompressedWriter(fout, dtype, compression)
+            sizes = _stream_values(writer.write, data, element, dtype, transform, reduce)
+            writer.close()
+
+    os.replace(path+'.tmp', path)
+
+    if(os.path.exists(stale)): # only one encoding of the sidecar is kept
+        os.remove(stale)
+
+    starts = np.cumsum(sizes) - sizes
+
+    for feature, start, size in zip(data, starts.tolist(), sizes.tolist()):
+        feature['geometry'][element] = [start, size] # where this vector starts and its size
+
+def _stream_values(write, data, element, dtype, transform=None, reduce=None):
+    '''
+        Calls write with chunks of (at least) WRITE_CHUNK_SIZE values of the element of every feature and returns the size of each feature
+
+        transform is applied to the (float64) values of each feature before they are converted to dtype.
+        reduce (if given) is called with every chunk, as stored, and the sizes of the features in it (e.g. to compute their bounding boxes while they are written)
+    '''
+
+    sizes = np.zeros(len(data), dtype=np.int64)
+
+    chunk = []
+    chunk_size = 0
+    chunk_first = 0 # first feature of the chunk
+
+    def flush(end):
+        values = np.concatenate(chunk)
+        write(values)
+
+        if(reduce != None):
+            reduce(values, sizes[chunk_first:end])
+
+    for i, feature in enumerate(data):
+        if(transform != None):
+            values = transform(np.asarray(feature['geometry'][element], dtype=np.float64).ravel()).astype(dtype)
+        else:
+            values = np.asarray(feature['geometry'][element], dtype=dtype).ravel()
+
+        sizes[i] = values.size
+
+        chunk.append(values)
+        chunk_size += values.size
+
+        if(chunk_size >= WRITE_CHUNK_SIZE):
+            flush(i+1)
+            chunk = []
+            chunk_size = 0
+            chunk_first = i+1
+
+    if(len(chunk) > 0):
+        flush(len(data))
+
+    return sizes
+
+def write_sidecars(directory, layer_name, data, types, dataTypes, compression=None, local_origin=False):
+    '''
+        Writes the sidecars of all types of a physical layer (see write_sidecar)
+
+        * @param {bool} local_origin Stores the coordinates as float32 offsets from the center of the layer
+        * @returns {dict} Fields that must be added to the layer json to describe the encoding of the sidecars
+    '''
+
+    header = {}
+
+    if(compression != None):
+        header['compression'] = compression
+
+    if(local_origin and 'coordinates' in types):
+        header['origin'] = compute_origin(data)
+
+    bboxes = _BBoxReducer(header.get('origin', None))
+
+    for index, element in enumerate(types):
+        origin = header['origin'] if element == 'coordinates' and local_origin else None
+        write_sidecar(directory, layer_name, element, data, dataTypes[index], compression, origin, bboxes.reduce if element == 'coordinates' else None)
+
+    if('coordinates' in types):
+        write_bboxes(directory, layer_name, bboxes.result())
+    elif(os.path.exists(bbox_path(directory, layer_name))):
+        os.remove(bbox_path(directory, layer_name))
+
+    return header
+
+'''
+    Per-feature 3D bounding boxes (minx, miny, minz, maxx, maxy, maxz) stored as a (features, 6) float32 sidecar.
+    The boxes are rounded outwards, so they always contain the coordinates of the feature. Features without coordinates have NaN boxes
+'''
+BBOX_TYPE = 'f'
+BBOX_ELEMENT = 'bbox'
+
+def bbox_path(directory, layer_name):
+    return sidecar_path(directory, layer_name, BBOX_ELEMENT)
+
+def compute_bboxes(coordinates, starts, sizes, dimensions=3):
+    '''
+        Bounding boxes of the [start, start+size) ranges of a flat coordinates array using np.minimum.reduceat/np.maximum.reduceat
+
+        * @returns {np.ndarray} (features, 2*dimensions) float32 array
+    '''
+
+    starts = np.asarray(starts, dtype=np.int64) // dimensions
+    counts = np.asarray(sizes, dtype=np.int64) // dimensions
+
+    points = np.asarray(coordinates).reshape(-1, dimensions)
+
+    if(np.array_equal(starts, np.cumsum(counts) - counts)): # features stored contiguously
+        points = points[:int(counts.sum())]
+    else:
+        points = points[gather_indices(starts, counts)]
+        starts = np.cumsum(counts) - counts
+
+    bboxes = np.full((len(counts), 2*dimensions), np.nan, dtype=np.float64)
+
+    # reduceat does not support empty ranges, but skipping them keeps each range ending where the next non empty one starts
+    nonempty = counts > 0
+
+    if(nonempty.any()):
+        bboxes[nonempty, :dimensions] = np.minimum.reduceat(points, starts[nonempty], axis=0)
+        bboxes[nonempty, dimensions:] = np.maximum.reduceat(points, starts[nonempty], axis=0)
+
+    result = bboxes.astype(BBOX_TYPE)
+
+    lower = result[:, :dimensions] > bboxes[:, :dimensions]
+    upper = result[:, dimensions:] < bboxes[:, dimensions:]
+    result[:, :dimensions][lower] = np.nextafter(result[:, :dimensions][lower], np.float32(-np.inf))
+    result[:, dimensions:][upper] = np.nextafter(result[:, dimensions:][upper], np.float32(np.inf))
+
+    return result
+
+class _BBoxReducer:
+    '''
+        Bounding boxes of the features computed chunk by chunk while their coordinates are streamed (see _stream_values).
+        The boxes are computed from the stored values (float32 offsets moved back to origin for local-origin layers), so they match what loaders read
+    '''
+
+    def __init__(self, origin=None):
+        self.origin = origin
+        self.bboxes = []
+
+    def reduce(self, values, sizes):
+
+        if(self.origin != None):
+            values = from_local_origin(values, self.origin)
+
+        self.bboxes.append(compute_bboxes(values, np.cumsum(sizes) - sizes, sizes))
+
+    def result(self):
+        '''
+            (features, 6) bounding boxes of all the features reduced so far
+        '''
+
+        if(len(self.bboxes) == 0):
+            return np.zeros((0, 6), dtype=BBOX_TYPE)
+
+        return np.concatenate(self.bboxes)
+
+def write_bboxes(directory, layer_name, bboxes):
+    '''
+        Writes the bounding box sidecar of a layer
+
+        * @param {np.ndarray} bboxes (features, 6) boxes (see _BBoxReducer and compute_bboxes)
+    '''
+
+    path = bbox_path(directory, layer_name)
+
+    with open(path+'.tmp', 'wb') as fout:
+        np.asarray(bboxes, dtype=BBOX_TYPE).tofile(fout)
+
+    os.replace(path+'.tmp', path)
+
+'''
+    Features deleted from a saved layer are listed (by index) in a uint32 sidecar until the layer is compacted
+'''
+TOMBSTONES_TYPE = 'I'
+
+def tombstones_path(filepath):
+    return os.path.splitext(filepath)[0]+'_tombstones.data'
+
+def read_tombstones(filepath):
+    '''
+        Sorted indices of the deleted features of a layer
+    '''
+
+    path = tombstones_path(filepath)
+
+    if(not os.path.exists(path)):
+        return np.empty(0, dtype=np.int64)
+
+    return np.unique(np.fromfile(path, dtype=TOMBSTONES_TYPE)).astype(np.int64)
+
+def append_tombstones(filepath, indices):
+
+    with open(tombstones_path(filepath), 'ab') as fout:
+        np.asarray(indices, dtype=TOMBSTONES_TYPE).tofile(fout)
+
+def gather_indices(starts, sizes):
+    '''
+        Positions of the values of the [start, start+size) ranges, concatenated in order
+    '''
+
+    starts = np.asarray(starts, dtype=np.int64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+
+    return np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + np.arange(int(sizes.sum()), dtype=np.int64)
+
+'''
+    Number of items of a streamed array serialized at a time by write_layer_json
+'''
+JSON_CHUNK_SIZE = 1 << 16
+
+'''
+    Fields of a layer json that are streamed item by item: the features of physical layers and the coordinates/values of abstract layers
+'''
+STREAMED_JSON_FIELDS = ['data', 'coordinates', 'values']
+
+def write_layer_json(filepath, layer):
+    '''
+        Writes the json file of a layer without serializing it as a whole.
+
+        The fields in STREAMED_JSON_FIELDS (lists or numpy arrays) are written in chunks of JSON_CHUNK_SIZE items, so peak memory is bounded
+        by a chunk and not by the size of the layer. numpy arrays do not have to be converted to lists beforehand.
+
+        * @param {string} filepath Path of the .json file
+        * @param {dict} layer Layer to be written
+    '''
+
+    with open(filepath+'.tmp', 'w') as fout:
+        fout.write('{')
+
+        for index, (key, value) in enumerate(layer.items()):
+            if(index > 0):
+                fout.write(', ')
+
+            fout.write(json.dumps(key)+': ')
+
+            if(key in STREAMED_JSON_FIELDS and isinstance(value, (list, np.ndarray))):
+                _stream_json_array(fout, value)
+            else:
+                fout.write(json.dumps(value))
+
+        fout.write('}')
+
+    os.replace(filepath+'.tmp', filepath)
+
+def _stream_json_array(fout, values):
+
+    fout.write('[')
+
+    for start in range(0, len(values), JSON_CHUNK_SIZE):
+        chunk = values[start:start+JSON_CHUNK_SIZE]
+
+        if(isinstance(chunk, np.ndarray)):
+            chunk = chunk.tolist()
+
+        if(start > 0):
+            fout.write(', ')
+
+        fout.write(json.dumps(chunk)[1:-1]) # items of the chunk without the brackets
+
+    fout.write(']')
+
+'''
+    Binary abstract layers: the coordinates and values are stored in <name>_coordinates.data and <name>_values.data. As in the features of
+    physical layers, the json keeps the [start, size] pair of each array, and dataTypes has the type of each sidecar
+'''
+ABSTRACT_TYPES = {
+    'coordinates': 'd',
+    'values': 'f'
+}
+
+def write_abstract_layer(filepath, coordinates, values, layer_id=None):
+    '''
+        Writes an abstract layer with binary coordinates and values
+
+        * @param {string} filepath Path of the .json file
+        * @param {np.ndarray} coordinates Flat 3D coordinates of the points
+        * @param {np.ndarray} values Value of each point
+        * @param {string} layer_id Id of the layer. If None the file name is used
+    '''
+
+    directory = os.path.dirname(filepath)
+    name = os.path.splitext(os.path.basename(filepath))[0]
+
+    layer = {'id': name if layer_id == None else layer_id}
+
+    for element, array in [('coordinates', coordinates), ('values', values)]:
+        array = np.ascontiguousarray(array, dtype=ABSTRACT_TYPES[element]).reshape(-1)
+
+        path = sidecar_path(directory, name, element)
+        array.tofile(path+'.tmp')
+        os.replace(path+'.tmp', path)
+
+        layer[element] = [0, len(array)]
+
+    layer['dataTypes'] = ABSTRACT_TYPES
+
+    write_layer_json(filepath, layer)
+
+def read_abstract_layer(filepath):
+    '''
+        Reads an abstract layer. Binary coordinates and values are memory-mapped, layers with inline lists are returned as they are
+
+        * @param {string} filepath Path of the .json file
+        * @returns {dict} Layer with its coordinates and values
+    '''
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        layer = json.load(f)
+
+    if('dataTypes' in layer):
+        directory = os.path.dirname(filepath)
+        name = os.path.splitext(os.path.basename(filepath))[0]
+
+        for element, dtype in layer['dataTypes'].items():
+            start, size = layer[element]
+            layer[element] = read_sidecar(directory, name, element, dtype)[start:start+size]
+
+    return layer
+
+'''
+    Type of the coordinates stored relative to the origin of the layer
+'''
+LOCAL_COORDINATES_TYPE = 'f'
+
+def compute_origin(data, dimensions=3):
+    '''
+        Center of the bounding box of the coordinates of all features rounded to meters
+    '''
+
+    mins = []
+    maxs = []
+
+    for feature in data:
+        coordinates = np.asarray(feature['geometry']['coordinates'], dtype=np.float64).reshape(-1, dimensions)
+
+        if(len(coordinates) > 0):
+            mins.append(coordinates.min(axis=0))
+            maxs.append(coordinates.max(axis=0))
+
+    if(len(mins) == 0):
+        return [0.0]*dimensions
+
+    return np.round((np.min(mins, axis=0)+np.max(maxs, axis=0))/2).tolist()
+
+def to_local_origin(coordinates, origin):
+    '''
+        Flat float64 coordinates to flat float32 offsets from origin
+    '''
+
+    origin = np.asarray(origin, dtype=np.float64)
+
+    return (np.asarray(coordinates, dtype=np.float64).reshape(-1, len(origin)) - origin).astype(LOCAL_COORDINATES_TYPE).ravel()
+
+def from_local_origin(coordinates, origin):
+    '''
+        Flat float32 offsets from origin to flat float64 coordinates
+    '''
+
+    origin = np.asarray(origin, dtype=np.float64)
+
+    return (np.asarray(coordinates, dtype=np.float64).reshape(-1, len(origin)) + origin).ravel()
+
+'''
+    Compressed sidecars (.zdata files) split the values of a sidecar in chunks of SIDECAR_CHUNK_SIZE values compressed independently:
+
+    - prefix: magic, version, codec, type of the values, values per chunk, number of values, number of chunks, position of the chunk index
+    - compressed chunks
+    - chunk index: (chunks+1) uint64 array with the position of every chunk
+'''
+SIDECAR_CODECS = {
+    'zlib': (1, zlib.compress, zlib.decompress),
+    'lzma': (2, lzma.compress, lzma.decompress)
+}
+SIDECAR_CHUNK_SIZE = 1 << 16
+COMPRESSED_MAGIC = b'UTKZDATA'
+COMPRESSED_VERSION = 1
+
+_COMPRESSED_PREFIX = struct.Struct('<8sIBc2xQQQQ') # magic, version, codec, type, values per chunk, values, chunks, index position
+
+def compressed_sidecar_path(directory, layer_name, element):
+    return os.path.join(directory, layer_name+'_'+element+'.zdata')
+
+class _CompressedWriter:
+    '''
+        Buffers values and writes them as compressed chunks of SIDECAR_CHUNK_SIZE values
+    '''
+
+    def __init__(self, fout, dtype, compression):
+        if(compression not in SIDECAR_CODECS):
+            raise Exception("Unknown compression "+str(compression)+". Possible values: "+", ".join(SIDECAR_CODECS))
+
+        self.fout = fout
+        self.dtype = np.dtype(dtype)
+        self.codec, self.compress, _ = SIDECAR_CODECS[compression]
+        self.pending = np.empty(0, dtype=self.dtype)
+        self.count = 0
+        self.index = []
+
+        self.fout.write(_COMPRESSED_PREFIX.pack(COMPRESSED_MAGIC, COMPRESSED_VERSION, 0, b'\0', 0, 0, 0, 0))
+
+    def _write_chunk(self, values):
+        self.index.append(self.fout.tell())
+        self.fout.write(self.compress(values.tobytes()))
+
+    def write(self, values):
+        values = np.concatenate((self.pending, values.astype(self.dtype, copy=False)))
+        self.count += len(values)-len(self.pending)
+
+        full = len(values) - len(values) % SIDECAR_CHUNK_SIZE
+
+        for start in range(0, full, SIDECAR_CHUNK_SIZE):
+            self._write_chunk(values[start:start+SIDECAR_CHUNK_SIZE])
+
+        self.pending = values[full:].copy()
+
+    def close(self):
+        if(len(self.pending) > 0):
+            self._write_chunk(self.pending)
+            self.pending = np.empty(0, dtype=self.dtype)
+
+        index_position = self.fout.tell()
+        np.array(self.index+[index_position], dtype='<u8').tofile(self.fout)
+
+        self.fout.seek(0)
+        self.fout.write(_COMPRESSED_PREFIX.pack(COMPRESSED_MAGIC, COMPRESSED_VERSION, self.codec, self.dtype.char.encode('ascii'), SIDECAR_CHUNK_SIZE, self.count, len(self.index), index_position))
+        self.fout.seek(0, os.SEEK_END)
+
+class CompressedSidecar:
+    '''
+        Random access to the values of a compressed sidecar. Only the chunks touched by a read are decompressed
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            magic, version, codec, dtype, self.chunk_size, self.count, chunks, index_position = _COMPRESSED_PREFIX.unpack(f.read(_COMPRESSED_PREFIX.size))
+
+            if(magic != COMPRESSED_MAGIC or version > COMPRESSED_VERSION):
+                raise Exception(path+' is not a supported compressed sidecar')
+
+            f.seek(index_position)
+            self.index = np.fromfile(f, dtype='<u8', count=chunks+1)
+
+        self.dtype = np.dtype(dtype.decode('ascii'))
+        self.decompress = [elem[2] for elem in SIDECAR_CODECS.values() if elem[0] == codec][0]
+
+    def __len__(self):
+        return self.count
+
+    def read(self, start=0, end=None):
+        '''
+            Values in [start, end) of the sidecar
+        '''
+
+        if(end == None):
+            end = self.count
+
+        if(end <= start):
+            return np.empty(0, dtype=self.dtype)
+
+        first_chunk = start // self.chunk_size
+        last_chunk = (end-1) // self.chunk_size
+
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.index[first_chunk]))
+            compressed = f.read(int(self.index[last_chunk+1]-self.index[first_chunk]))
+
+        chunks = []
+        for chunk in range(first_chunk, last_chunk+1):
+            begin = int(self.index[chunk]-self.index[first_chunk])
+            size = int(self.index[chunk+1]-self.index[chunk])
+            chunks.append(np.frombuffer(self.decompress(compressed[begin:begin+size]), dtype=self.dtype))
+
+        values = np.concatenate(chunks)
+        offset = first_chunk*self.chunk_size
+
+        return values[start-offset:end-offset]
+
+'''
+    Packed layers store the metadata and all sidecars of a physical layer in a single file:
+
+    - prefix (PACKED_SECTION_ALIGNMENT bytes): magic, version, position and size of the header
+    - one section per geometry element, each aligned to PACKED_SECTION_ALIGNMENT bytes
+    - bbox section with the bounding box of every feature (only if the layer has coordinates)
+    - feature offset table: (features+1, elements) uint32/uint64 array with the start of every feature in each section
+    - header: json with the layer metadata, the non binary fields of the features and the position of the sections
+'''
+PACKED_EXTENSION = '.utkpack'
+PACKED_MAGIC = b'UTKPACK\0'
+PACKED_VERSION = 1
+PACKED_SECTION_ALIGNMENT = 64
+
+_PACKED_PREFIX = struct.Struct('<8sIIQQ') # magic, version, reserved, header offset, header size
+
+def packed_path(filepath):
+    '''
+        Path of the packed version of a layer given the path of its .json (or of the packed file itself)
+    '''
+    return os.path.splitext(filepath)[0]+PACKED_EXTENSION
+
+def is_packed(filepath):
+    '''
+        True if filepath is a packed layer, or if it is a .json that does not exist but has a packed version
+    '''
+    if(os.path.splitext(filepath)[1] == PACKED_EXTENSION):
+        return True
+
+    return not os.path.exists(filepath) and os.path.exists(packed_path(filepath))
+
+def _align(fout):
+    padding = (-fout.tell()) % PACKED_SECTION_ALIGNMENT
+    fout.write(b'\0'*padding)
+    return fout.tell()
+
+def write_packed_layer(directory, layer, types, dataTypes, local_origin=False, name=None):
+    '''
+        Writes a physical layer as a single packed file (<name>.utkpack). The layer is not modified.
+        A previous <name>.json of the layer and its sidecars are deleted.
+
+        * @param {string} directory Folder where the layer will be stored
+        * @param {dict} layer Physical layer (json with a data field)
+        * @param {List[string]} types Geometry elements stored in binary sections
+        * @param {List[string]} dataTypes Type of each element
+        * @param {bool} local_origin Stores the coordinates as float32 offsets from the center of the layer
+        * @param {string} name Name of the file. If None the id of the layer is used
+        * @returns {string} Path of the packed file
+    '''
+
+    data = layer['data']
+
+    metadata = {key: layer[key] for key in layer if key != 'data' and key != 'origin'}
+
+    if(local_origin and 'coordinates' in types):
+        metadata['origin'] = compute_origin(data)
+
+    if(name == None):
+        name = layer['id']
+
+    path = os.path.join(directory, name+PACKED_EXTENSION)
+
+    sections = {}
+    table = np.zeros((len(data)+1, len(types)), dtype=np.uint64)
+
+    with open(path+'.tmp', 'wb') as fout:
+        fout.write(_PACKED_PREFIX.pack(PACKED_MAGIC, PACKED_VERSION, 0, 0, 0))
+
+        bboxes = _BBoxReducer(metadata.get('origin', None))
+
+        for index, element in enumerate(types):
+            dtype = dataTypes[index]
+            transform = None
+
+            if(element == 'coordinates' and 'origin' in metadata):
+                dtype = LOCAL_COORDINATES_TYPE
+                transform = lambda values: to_local_origin(values, metadata['origin'])
+
+            offset = _align(fout)
+            sizes = _stream_values(lambda values: values.tofile(fout), data, element, dtype, transform, bboxes.reduce if element == 'coordinates' else None)
+            table[1:, index] = np.cumsum(sizes)
+            sections[element] = {'offset': offset, 'type': dtype, 'count': int(table[-1, index])}
+
+        if('coordinates' in types):
+            boxes = bboxes.result() # computed while the coordinates were streamed
+
+            offset = _align(fout)
+            boxes.tofile(fout)
+            sections[BBOX_ELEMENT] = {'offset': offset, 'type': BBOX_TYPE, 'count': int(boxes.size)}
+
+        if(table.size == 0 or table.max() <= np.iinfo(np.uint32).max):
+            table = table.astype(np.uint32)
+
+        table_offset = _align(fout)
+        table.tofile(fout)
+
+        # non binary fields of the features (e.g. sectionFootprint)
+        features = []
+        for feature in data:
+            geometry = {key: feature['geometry'][key] for key in feature['geometry'] if key not in types}
+            features.append(dict(feature, geometry=geometry))
+
+        if(all(feature == {'geometry': {}} for feature in features)):
+            features = None
+
+        header = {
+            'layer': metadata,
+            'count': len(data),
+            'elements': types,
+            'sections': sections,
+            'table': {'offset': table_offset, 'type': table.dtype.str},
+            'features': features
+        }
+
+        header_offset = _align(fout)
+        header_bytes = json.dumps(header).encode('utf-8')
+        fout.write(header_bytes)
+
+        fout.seek(0)
+        fout.write(_PACKED_PREFIX.pack(PACKED_MAGIC, PACKED_VERSION, 0, header_offset, len(header_bytes)))
+
+    os.replace(path+'.tmp', path)
+
+    # only one encoding of the layer is kept. Otherwise loaders would keep reading the stale json (see is_packed)
+    remove_unpacked_layer(directory, name)
+
+    return path
+
+def remove_unpacked_layer(directory, layer_name):
+    '''
+        Deletes the .json of a layer and its sidecars (raw or compressed)
+    '''
+
+    stale = [os.path.join(directory, layer_name+'.json'), bbox_path(directory, layer_name)]
+
+    for element in SIDECAR_TYPES:
+        stale += [sidecar_path(directory, layer_name, element), compressed_sidecar_path(directory, layer_name, element)]
+
+    for path in stale:
+        if(os.path.exists(path)):
+            os.remove(path)
+
+def read_packed_header(filepath):
+
+    with open(filepath, 'rb') as f:
+        magic, version, _, header_offset, header_size = _PACKED_PREFIX.unpack(f.read(_PACKED_PREFIX.size))
+
+        if(magic != PACKED_MAGIC or version > PACKED_VERSION):
+            raise Exception(filepath+' is not a supported packed layer')
+
+        f.seek(header_offset)
+        return json.loads(f.read(header_size).decode('utf-8'))
+
+def read_packed_section(filepath, header, element):
+    '''
+        Memory-maps the section of a geometry element of a packed layer
+    '''
+
+    section = header['sections'][element]
+
+    if(section['count'] == 0):
+        return np.empty(0, dtype=section['type'])
+
+    return np.memmap(filepath, dtype=section['type'], mode='r', offset=section['offset'], shape=(section['count'],))
+
+def read_packed_table(filepath, header):
+    '''
+        Memory-maps the feature offset table of a packed layer. Row i has the start of feature i in every section
+    '''
+
+    return np.memmap(filepath, dtype=header['table']['type'], mode='r', offset=header['table']['offset'], shape=(header['count']+1, len(header['elements'])))
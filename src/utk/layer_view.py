@@ -0,0 +1,451 @@
+import os
+import json
+import threading
+import numpy as np
+
+from collections import OrderedDict
+
+from .layer_io import *
+
+class LayerView:
+    '''
+        Lazy access to a physical layer stored as a json file plus binary sidecars (or as a packed layer).
+
+        Opening a view only reads the metadata of the features (O(number of features)). The sidecars are memory-mapped
+        (or decompressed) the first time an element is accessed.
+    '''
+
+    def __init__(self, filepath):
+
+        '''
+            * @param {string} filepath Path of the .json of the layer (or of its .utkpack)
+        '''
+
+        self.filepath = filepath
+        self.directory = os.path.dirname(filepath)
+        self.name = os.path.splitext(os.path.basename(filepath))[0]
+        self.packed = is_packed(filepath)
+
+        self._offsets = {} # (starts, sizes) of each element
+        self._values = {} # flat arrays already loaded
+
+        if(self.packed):
+            self.path = packed_path(filepath)
+            self.header = read_packed_header(self.path)
+            self.layer = dict(self.header['layer'])
+            self.elements = list(self.header['elements'])
+
+            if(self.header['features'] != None):
+                self.features = self.header['features']
+            else:
+                self.features = [{'geometry': {}} for i in range(self.header['count'])]
+
+            if(len(self.elements) > 0):
+                table = np.array(read_packed_table(self.path, self.header), dtype=np.int64)
+
+                for index, element in enumerate(self.elements):
+                    self._offsets[element] = (table[:-1, index], np.diff(table[:, index]))
+        else:
+            self.path = filepath
+            self.header = None
+
+            with open(filepath, mode='r') as f:
+                self.layer = json.load(f)
+
+            if('data' not in self.layer):
+                raise Exception(filepath+' is not a physical layer')
+
+            data = self.layer.pop('data')
+
+            self.elements = [element for element in SIDECAR_TYPES if len(data) > 0 and element in data[0]['geometry']]
+
+            for element in self.elements:
+                pairs = np.array([feature['geometry'][element] for feature in data], dtype=np.int64).reshape(-1, 2)
+                self._offsets[element] = (pairs[:,0], pairs[:,1])
+
+            # only the fields that are not stored in the sidecars are kept
+            self.features = []
+            for feature in data:
+                geometry = {key: feature['geometry'][key] for key in feature['geometry'] if key not in self.elements}
+                self.features.append(dict(feature, geometry=geometry))
+
+        self.compression = self.layer.get('compression', None)
+        self.origin = self.layer.get('origin', None)
+
+        # features deleted with delete_features are skipped until the layer is compacted
+        self.count = len(self.features) # features stored in the files
+        self.tombstones = read_tombstones(filepath)
+        self._keep = None
+
+        if(len(self.tombstones) > 0):
+            keep = np.ones(self.count, dtype=bool)
+            keep[self.tombstones] = False
+            self._keep = keep
+
+            self.features = [feature for feature, kept in zip(self.features, keep.tolist()) if kept]
+
+            for element in self.elements:
+                starts, sizes = self._offsets[element]
+                self._offsets[element] = (starts[keep], sizes[keep])
+
+    def __len__(self):
+        return len(self.features)
+
+    def __getitem__(self, index):
+        return self.feature(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.feature(index)
+
+    def offsets(self, element):
+        '''
+            (starts, sizes) of element for every feature
+        '''
+        return self._offsets[element]
+
+    def _read(self, element, start=0, end=None):
+        '''
+            Values of element in [start, end) of its sidecar. Coordinates stored relative to an origin are converted back to absolute coordinates
+        '''
+
+        if(self.packed):
+            values = read_packed_section(self.path, self.header, element)[start:end]
+        elif(self.compression != None):
+            values = CompressedSidecar(compressed_sidecar_path(self.directory, self.name, element)).read(start, end)
+        else:
+            dtype = LOCAL_COORDINATES_TYPE if element == 'coordinates' and self.origin != None else None
+            values = read_sidecar(self.directory, self.name, element, dtype)[start:end]
+
+        if(element == 'coordinates' and self.origin != None):
+            values = from_local_origin(values, self.origin)
+
+        return values
+
+    def values(self, element):
+        '''
+            All values of element in the order they are stored
+        '''
+
+        if(element not in self._values):
+            values = self._read(element)
+            values.flags.writeable = False # views of the values are shared by every user of a cached layer
+            self._values[element] = values
+
+        return self._values[element]
+
+    def _range(self, element, first, last):
+        '''
+            Values covering element for the features in [first, last) and the position of the first value in the sidecar
+        '''
+
+        if(element in self._values or (self.compression == None and self.origin == None) or last <= first):
+            return self.values(element), 0
+
+        starts, sizes = self.offsets(element)
+        start = int(starts[first:last].min())
+        end = int((starts[first:last]+sizes[first:last]).max())
+
+        return self._read(element, start, end), start
+
+    def flat(self, element):
+        '''
+            Values of element of all features concatenated in the order of the features
+        '''
+
+        starts, sizes = self.offsets(element)
+        values = self.values(element)
+
+        if(np.array_equal(starts, np.cumsum(sizes)-sizes)): # features stored contiguously
+            return values[:int(sizes.sum())]
+
+        return np.concatenate([values[start:start+size] for start, size in zip(starts.tolist(), sizes.tolist())])
+
+    @property
+    def nbytes(self):
+        '''
+            Memory used by the offsets and the values already loaded
+        '''
+
+        nbytes = sum(values.nbytes for values in self._values.values())
+        nbytes += sum(starts.nbytes+sizes.nbytes for starts, sizes in self._offsets.values())
+
+        return nbytes
+
+    @property
+    def bboxes(self):
+        '''
+            (features, 6) float32 bounding boxes (minx, miny, minz, maxx, maxy, maxz) of the features.
+
+            Read from the bbox table of the layer without loading the geometry. Layers saved without the table compute it from the coordinates
+        '''
+
+        if(BBOX_ELEMENT not in self._values):
+            bboxes = None
+
+            if(self.packed and BBOX_ELEMENT in self.header['sections']):
+                bboxes = read_packed_section(self.path, self.header, BBOX_ELEMENT)
+            elif(not self.packed and os.path.exists(bbox_path(self.directory, self.name))):
+                bboxes = read_sidecar(self.directory, self.name, BBOX_ELEMENT, BBOX_TYPE)
+
+            if(bboxes is not None and bboxes.size == self.count*6):
+                bboxes = bboxes.reshape(-1, 6)
+
+                if(self._keep is not None):
+                    bboxes = bboxes[self._keep]
+            else:
+                if('coordinates' not in self.elements):
+                    raise Exception('Layer does not have a coordinates field')
+
+                bboxes = compute_bboxes(self.values('coordinates'), *self.offsets('coordinates'))
+
+            bboxes.flags.writeable = False
+            self._values[BBOX_ELEMENT] = bboxes
+
+        return self._values[BBOX_ELEMENT]
+
+    @property
+    def coordinates(self):
+        return self.flat('coordinates')
+
+    @property
+    def indices(self):
+        return self.flat('indices')
+
+    @property
+    def normals(self):
+        return self.flat('normals')
+
+    @property
+    def ids(self):
+        return self.flat('ids')
+
+    def geometry(self, index, element):
+        '''
+            Values of element of one feature
+        '''
+
+        starts, sizes = self.offsets(element)
+        values, offset = self._range(element, index, index+1)
+        start = int(starts[index])-offset
+
+        return values[start:start+int(sizes[index])]
+
+    def feature(self, index):
+        '''
+            Feature with the same structure of the features loaded by load_utk
+        '''
+        return self.to_json([index, index+1])['data'][0]
+
+    def to_json(self, features=None):
+        '''
+            Materializes the layer (or the [start, end) range of features) as a json whose geometries are views of the sidecars
+        '''
+
+        first, last = (0, len(self)) if features == None else (max(features[0], 0), min(features[1], len(self)))
+
+        data = []
+        for feature in self.features[first:last]:
+            data.append(dict(feature, geometry=dict(feature['geometry'])))
+
+        for element in self.elements:
+            starts, sizes = self.offsets(element)
+            values, offset = self._range(element, first, last)
+
+            for i, (start, size) in enumerate(zip(starts[first:last].tolist(), sizes[first:last].tolist())):
+                data[i]['geometry'][element] = values[start-offset:start-offset+size]
+
+        layer = dict(self.layer)
+        layer['data'] = data
+
+        return layer
+
+'''
+    Process-wide cache of opened layers shared by load_utk, FilesInterface and ShadowAccumulator.
+
+    Layers are keyed by path and invalidated when their files change. The least recently used layers are evicted when
+    the memory used by the cached layers (LayerView.nbytes) exceeds the budget.
+'''
+LAYER_CACHE_BUDGET = 1 << 30 # bytes
+
+_layer_cache = OrderedDict() # path -> (stamp, view)
+_layer_cache_lock = threading.Lock()
+
+def _layer_stamp(filepath):
+    '''
+        Identifies the version of the files of a layer: the json (or .utkpack), its sidecars (raw or compressed), bbox and tombstones.
+        A sidecar replaced without touching the json changes the stamp, so the cached memmaps are not reused
+    '''
+
+    packed = is_packed(filepath)
+
+    path = packed_path(filepath) if packed else filepath
+    stat = os.stat(path)
+    stamp = (path, stat.st_mtime_ns, stat.st_size)
+
+    if(not packed):
+        directory = os.path.dirname(filepath)
+        name = os.path.splitext(os.path.basename(filepath))[0]
+
+        for element in list(SIDECAR_TYPES) + [BBOX_ELEMENT]:
+            for sidecar in [sidecar_path(directory, name, element), compressed_sidecar_path(directory, name, element)]:
+                if(os.path.exists(sidecar)):
+                    stat = os.stat(sidecar)
+                    stamp += (sidecar, stat.st_mtime_ns, stat.st_size)
+
+    if(os.path.exists(tombstones_path(filepath))):
+        stat = os.stat(tombstones_path(filepath))
+        stamp += (stat.st_mtime_ns, stat.st_size)
+
+    return stamp
+
+def open_layer(filepath):
+    '''
+        LayerView of a layer, reusing the one already opened in this process if the layer did not change
+    '''
+
+    if(LAYER_CACHE_BUDGET <= 0):
+        return LayerView(filepath)
+
+    key = os.path.abspath(filepath)
+    stamp = _layer_stamp(filepath)
+
+    with _layer_cache_lock:
+        if(key in _layer_cache and _layer_cache[key][0] == stamp):
+            _layer_cache.move_to_end(key)
+            view = _layer_cache[key][1]
+        else:
+            view = None
+
+    if(view == None):
+        view = LayerView(filepath)
+
+        with _layer_cache_lock:
+            _layer_cache[key] = (stamp, view)
+            _layer_cache.move_to_end(key)
+
+    _evict_layers()
+
+    return view
+
+def _evict_layers():
+
+    with _layer_cache_lock:
+        # views load their values lazily, so the memory used is measured again on every eviction
+        total = sum(view.nbytes for _, view in _layer_cache.values())
+
+        while(total > LAYER_CACHE_BUDGET and len(_layer_cache) > 1):
+            _, (_, view) = _layer_cache.popitem(last=False)
+            total -= view.nbytes
+
+def set_layer_cache_budget(nbytes):
+    '''
+        Sets the maximum memory (in bytes) used by cached layers. 0 disables the cache
+    '''
+
+    global LAYER_CACHE_BUDGET
+    LAYER_CACHE_BUDGET = nbytes
+
+    if(nbytes <= 0):
+        clear_layer_cache()
+    else:
+        _evict_layers()
+
+def clear_layer_cache():
+
+    with _layer_cache_lock:
+        _layer_cache.clear()
+
+def delete_features(filepath, ids, ignore_missing=False):
+    '''
+        Marks features of a saved physical layer as deleted. Only the indices are appended to the tombstones sidecar (O(removed)):
+        the number of features is taken from the bbox sidecar or the packed header, and the json and the geometry sidecars are not read or rewritten until compact_layer is called.
+
+        Layers opened in Python (load_utk, FilesInterface, ShadowAccumulator) skip deleted features. The frontend reads the sidecars
+        directly, so the layer must be compacted before it is served.
+
+        * @param {string} filepath Path of the .json of the layer (or of its .utkpack)
+        * @param {List[int]} ids Indices of the features in the stored layer. They do not change until the layer is compacted
+        * @param {bool} ignore_missing Ids outside the layer are skipped instead of raising an exception
+    '''
+
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+    if(len(ids) == 0):
+        return
+
+    count = _feature_count(filepath)
+
+    if(ignore_missing):
+        ids = ids[(ids >= 0) & (ids < count)]
+
+        if(len(ids) == 0):
+            return
+    elif(ids[0] < 0 or ids[-1] >= count):
+        raise Exception('Feature index out of range. The layer has '+str(count)+' features')
+
+    # ids deleted twice are merged by read_tombstones
+    append_tombstones(filepath, ids)
+
+def _feature_count(filepath):
+    '''
+        Number of features of a saved layer without opening it: the count of the packed header, or the number of rows of the bbox sidecar.
+        Only layers without coordinates (no bbox sidecar) have their json parsed
+    '''
+
+    if(is_packed(filepath)):
+        return read_packed_header(packed_path(filepath))['count']
+
+    path = bbox_path(os.path.dirname(filepath), os.path.splitext(os.path.basename(filepath))[0])
+
+    if(os.path.exists(path)):
+        return os.path.getsize(path) // (6 * np.dtype(BBOX_TYPE).itemsize)
+
+    return open_layer(filepath).count
+
+def compact_layer(filepath):
+    '''
+        Removes the features marked by delete_features from the json and the sidecars of a layer, keeping its encoding
+        (compression, local origin or packed file). Values are gathered in one vectorized pass per element and the [start, size]
+        offsets of the remaining features are recomputed.
+
+        * @param {string} filepath Path of the .json of the layer (or of its .utkpack)
+        * @returns {int} Number of features removed
+    '''
+
+    view = LayerView(filepath)
+
+    if(len(view.tombstones) == 0):
+        return 0
+
+    data = [dict(feature, geometry=dict(feature['geometry'])) for feature in view.features]
+    dataTypes = []
+
+    for element in view.elements:
+        starts, sizes = view.offsets(element)
+        values = view.values(element)[gather_indices(starts, sizes)]
+
+        for feature, geometry in zip(data, np.split(values, np.cumsum(sizes)[:-1])):
+            feature['geometry'][element] = geometry
+
+        dataTypes.append(values.dtype.char)
+
+    local_origin = view.origin != None
+
+    if(view.packed):
+        layer = dict(view.layer)
+        layer['data'] = data
+
+        write_packed_layer(view.directory, layer, view.elements, dataTypes, local_origin, view.name)
+    else:
+        header = write_sidecars(view.directory, view.name, data, view.elements, dataTypes, view.compression, local_origin)
+
+        layer = {key: view.layer[key] for key in view.layer if key not in ['compression', 'origin']}
+        layer.update(header)
+        layer['data'] = data
+
+        write_layer_json(view.filepath, layer)
+
+    os.remove(tombstones_path(filepath))
+
+    return len(view.tombstones)
@@ -2,68 +2,36 @@ import os
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-import json
 import mapbox_earcut as earcut
-import struct
 from .utils import *
+from .layer_io import *
 from shapely import wkt
 
 from shapely.geometry import Point, Polygon
 
-def break_into_binary(filepath, filename, data, types, dataTypes, type='TRIANGLES_3D_LAYER', renderStyle=['FLAT_COLOR'], styleKey='surface'):
+def break_into_binary(filepath, filename, data, types, dataTypes, type='TRIANGLES_3D_LAYER', renderStyle=['FLAT_COLOR'], styleKey='surface', compression=None, local_origin=False):
 
-    for index, element in enumerate(types):
+    features = data['data'] if 'data' in data else data
 
-        readCoords = 0
+    header = write_sidecars(filepath, filename, features, types, dataTypes, compression, local_origin)
 
-        floatList = []
+    layer = {
+        "id": filename,
+        "type": type,
+        "renderStyle": renderStyle,
+        "styleKey": styleKey,
+        "data": data
+    }
 
-        if('data' in data):
-            for i in range(len(data['data'])):
-                geometry = data['data'][i]['geometry']
+    layer.update(header)
 
-                newValue = [readCoords, len(geometry[element])] # where this vector starts and its size
-
-                readCoords += len(geometry[element])
-
-                floatList += geometry[element].copy()
-
-                geometry[element] = newValue
-        else:
-            for i in range(len(data)):
-                geometry = data[i]['geometry']
-
-                newValue = [readCoords, len(geometry[element])] # where this vector starts and its size
-
-                readCoords += len(geometry[element])
-
-                floatList += geometry[element].copy()
-
-                geometry[element] = newValue
-
-        fout = open(os.path.join(filepath,filename+'_'+element+'.data'), 'wb')
-
-        buf = struct.pack(str(len(floatList))+dataTypes[index], *floatList)
-
-        fout.write(buf)
-        fout.close()
-
-        layer = {
-            "id": filename,
-            "type": type,
-            "renderStyle": renderStyle,
-            "styleKey": styleKey,
-            "data": data
-        }
-
-        with open(os.path.join(filepath,filename+".json"), "w") as outfile:
-            outfile.write(json.dumps(layer))
+    write_layer_json(os.path.join(filepath,filename+".json"), layer)
 
 '''
     Geometry column must be a string representing a Polygon in the WKT format
 '''
 
-def physical_from_csv(filepath, geometry_column='geometry', crs='4326', renderStyle=['FLAT_COLOR'], styleKey='surface'):
+def physical_from_csv(filepath, geometry_column='geometry', crs='4326', renderStyle=['FLAT_COLOR'], styleKey='surface', local_origin=False):
     
     df = pd.read_csv(filepath)
 
@@ -78,9 +46,9 @@ def physical_from_csv(filepath, geometry_column='geometry', crs='4326', renderSt
     # file name without extension
     file_name_wo_extension = os.path.splitext(file_name)[0]
 
-    break_into_binary(directory, file_name_wo_extension, mesh, ["coordinates", "indices"], ["d", "I"], 'TRIANGLES_3D_LAYER', renderStyle, styleKey)
+    break_into_binary(directory, file_name_wo_extension, mesh, ["coordinates", "indices"], ["d", "I"], 'TRIANGLES_3D_LAYER', renderStyle, styleKey, local_origin=local_origin)
 
-def physical_from_geojson(filepath, bbox = None, renderStyle=['FLAT_COLOR'], styleKey='surface'):
+def physical_from_geojson(filepath, bbox = None, renderStyle=['FLAT_COLOR'], styleKey='surface', local_origin=False):
 
     gdf = gpd.read_file(filepath)
 
@@ -94,7 +62,7 @@ def physical_from_geojson(filepath, bbox = None, renderStyle=['FLAT_COLOR'], sty
     # file name without extension
     file_name_wo_extension = os.path.splitext(file_name)[0]
 
-    break_into_binary(directory, file_name_wo_extension, mesh, ["coordinates", "indices"], ["d", "I"], 'TRIANGLES_3D_LAYER', renderStyle, styleKey)
+    break_into_binary(directory, file_name_wo_extension, mesh, ["coordinates", "indices"], ["d", "I"], 'TRIANGLES_3D_LAYER', renderStyle, styleKey, local_origin=local_origin)
 
 '''
     Geometry has to be Polygon or Multipolygon
@@ -124,24 +92,16 @@ def mesh_from_gdf(gdf):
 
             nodes = np.array(nodes)
 
-            nodes = nodes.flatten().tolist()
-            indices = indices.tolist()
-
-            nodes_3d = []
-
-            for i in range(int(len(nodes)/2)):
-                nodes_3d.append(nodes[i*2])
-                nodes_3d.append(nodes[i*2+1])
-                nodes_3d.append(0)
+            nodes_3d = np.column_stack((nodes, np.zeros(len(nodes))))
 
-            mesh.append({'geometry': {'coordinates': [round(item,4) for item in nodes_3d], 'indices': indices}})
+            mesh.append({'geometry': {'coordinates': np.round(nodes_3d, 4).ravel().tolist(), 'indices': indices.tolist()}})
 
     return mesh
 
 '''
     Generate mesh json file based on shapefile
 '''
-def physical_from_shapefile(filepath, layerName, bpoly=None, isBbox = False, renderStyle=['FLAT_COLOR'], styleKey='surface'):
+def physical_from_shapefile(filepath, layerName, bpoly=None, isBbox = False, renderStyle=['FLAT_COLOR'], styleKey='surface', local_origin=False):
     '''
         In the same folder as the .shp file there must be a .prj and .shx files   
 
@@ -221,46 +181,31 @@ def physical_from_shapefile(filepath, layerName, bpoly=None, isBbox = False, ren
 
         data.append({
             "geometry": {
-                "coordinates": [round(item,4) for item in coordinates.copy()],
+                "coordinates": np.round(coordinates, 4).tolist(),
                 "indices": indices.copy()
             }
         })
 
-    outputfile = os.path.join(os.path.dirname(filepath), layerName+'.json') 
-
-    with open(outputfile, "w", encoding="utf-8") as f:
-        
-        # result = {
-        #     "id": layerName,
-        #     "type": type,
-        #     "renderStyle": renderStyle,
-        #     "styleKey": styleKey,
-        #     "data": data
-        # }
-
-        types = []
-        dataTypes = []
-
-        if('coordinates' in data[0]['geometry']):
-            types.append("coordinates")
-            dataTypes.append("d")
+    types = []
+    dataTypes = []
 
-        if('normals' in data[0]['geometry']):
-            types.append("normals")
-            dataTypes.append("f")
+    if('coordinates' in data[0]['geometry']):
+        types.append("coordinates")
+        dataTypes.append("d")
 
-        if('indices' in data[0]['geometry']):
-            types.append("indices")
-            dataTypes.append("I")
+    if('normals' in data[0]['geometry']):
+        types.append("normals")
+        dataTypes.append("f")
 
-        if('ids' in data[0]['geometry']):
-            types.append("ids")
-            dataTypes.append("I")
+    if('indices' in data[0]['geometry']):
+        types.append("indices")
+        dataTypes.append("I")
 
-        break_into_binary(os.path.dirname(filepath), layerName, data, types, dataTypes, 'TRIANGLES_3D_LAYER', renderStyle, styleKey)
+    if('ids' in data[0]['geometry']):
+        types.append("ids")
+        dataTypes.append("I")
 
-        # layer_json_str = str(json.dumps(result))
-        # f.write(layer_json_str)
+    break_into_binary(os.path.dirname(filepath), layerName, data, types, dataTypes, 'TRIANGLES_3D_LAYER', renderStyle, styleKey, local_origin=local_origin)
 
     loaded_shp['id'] = objectId
 
@@ -273,7 +218,7 @@ def physical_from_shapefile(filepath, layerName, bpoly=None, isBbox = False, ren
 
     Considers that coordinates do not have a coordinates system but are in meters
 '''
-def physical_from_npy(filepath, layer_id, center_around=[]):
+def physical_from_npy(filepath, layer_id, center_around=[], local_origin=False):
         
     coordinates = np.load(filepath)
     coordinates = coordinates.flatten()
@@ -281,4 +226,4 @@ def physical_from_npy(filepath, layer_id, center_around=[]):
     if(len(center_around) > 0):
         coordinates = center_coordinates_around(coordinates, center_around)
 
-    break_into_binary(os.path.dirname(filepath), layer_id, [{'geometry': {'coordinates': [round(item,4) for item in coordinates]}}], ["coordinates"], ["d"], "POINTS_LAYER", ["FLAT_COLOR_POINTS"], "surface")
\ No newline at end of file
+    break_into_binary(os.path.dirname(filepath), layer_id, [{'geometry': {'coordinates': np.round(coordinates, 4)}}], ["coordinates"], ["d"], "POINTS_LAYER", ["FLAT_COLOR_POINTS"], "surface", local_origin=local_origin)
\ No newline at end of file
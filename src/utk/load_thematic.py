@@ -1,10 +1,10 @@
 from pyproj import Transformer
 import pandas as pd
 import os
-import json
 from netCDF4 import Dataset
 import numpy as np
 from .utils import *
+from .layer_io import write_layer_json
 
 '''
     Converts a dataframe into an abstract layer
@@ -18,7 +18,7 @@ def thematic_from_df(df, output_filepath, latitude_column, longitude_column, coo
     
     z_list = []
     if z_column != None:
-       z_list = df[z_column].toList()
+       z_list = df[z_column].tolist()
 
     if value_column != None:
         values_list = df[value_column].tolist()
@@ -26,35 +26,21 @@ def thematic_from_df(df, output_filepath, latitude_column, longitude_column, coo
         values_list = [1] * len(latitude_list)
 
     transformer = Transformer.from_crs(coordinates_projection, 3395)
-    points = list(zip(latitude_list, longitude_list))
+    x, y = transformer.transform(np.asarray(latitude_list, dtype=np.float64), np.asarray(longitude_list, dtype=np.float64))
 
-    coordinates = []
-
-    for index, point in enumerate(transformer.itransform(points)):
-    
-        z_value = 0
-
-        if(len(z_list) > 0):
-            z_value = z_list[index]
-
-        coordinates.append(point[0])
-        coordinates.append(point[1])
-        coordinates.append(z_value)
+    z = np.asarray(z_list, dtype=np.float64) if len(z_list) > 0 else np.zeros(len(latitude_list))
 
     abstract_json = {
         "id": os.path.basename(output_filepath),
-        "coordinates": coordinates,
-        "values": [elem for elem in values_list]
+        "coordinates": np.column_stack((x, y, z)).ravel(),
+        "values": values_list
     }
 
-    json_object = json.dumps(abstract_json)
-
     directory = os.path.dirname(output_filepath)
     if not os.path.exists(directory):
         os.makedirs(directory)
     
-    with open(output_filepath, "w") as outfile:
-        outfile.write(json_object)
+    write_layer_json(output_filepath, abstract_json)
 
 '''
     Converts a csv file into an abstract layer
@@ -116,7 +102,6 @@ def thematic_from_netcdf(filepath, layer_id, value_variable, latitude_variable,
 
         mask_values = np.ma.getmask(temp_masked)
 
-    coordinates = []
     values = []
     points = []
 
@@ -130,24 +115,18 @@ def thematic_from_netcdf(filepath, layer_id, value_variable, latitude_variable,
 
                 values.append(float(temp[i][j]))
 
-    for point in transformer.itransform(points):
-
-        coordinates.append(float(point[0]))
-        coordinates.append(float(point[1]))
-        coordinates.append(0)
+    points = np.array(points, dtype=np.float64).reshape(-1, 2)
+    x, y = transformer.transform(points[:,0], points[:,1])
 
     abstract_json = {
         "id": layer_id,
-        "coordinates": coordinates,
+        "coordinates": np.column_stack((x, y, np.zeros(len(points)))).ravel(),
         "values": values
     }
 
-    json_object = json.dumps(abstract_json)
-
     directory = os.path.dirname(filepath)
 
-    with open(os.path.join(directory,layer_id+".json"), "w") as outfile:
-        outfile.write(json_object)
+    write_layer_json(os.path.join(directory,layer_id+".json"), abstract_json)
 
 '''
     Thematic data from numpy array file 
@@ -168,19 +147,16 @@ def thematic_from_npy(filepath_coordinates, filepath_values, layer_id, center_ar
     flat_values = []
 
     if(isinstance(values[0], np.ndarray)):
-        flat_values = [item for row in values for item in row] 
+        flat_values = np.concatenate(values)
     else:
-        flat_values = values.tolist()
+        flat_values = values
 
     abstract_json = {
         "id": layer_id,
-        "coordinates": coordinates.tolist(),
+        "coordinates": coordinates,
         "values": flat_values
     }
 
-    json_object = json.dumps(abstract_json)
-    
     directory = os.path.dirname(filepath_coordinates)
 
-    with open(os.path.join(directory,layer_id+".json"), "w") as outfile:
-        outfile.write(json_object)
\ No newline at end of file
+    write_layer_json(os.path.join(directory,layer_id+".json"), abstract_json)
\ No newline at end of file
@@ -496,7 +496,7 @@ class OSM:
 
             nodes = utils.from_2d_to_3d(nodes)
 
-            mesh.append({'type': 'type', 'geometry': {'coordinates': [round(item,4) for item in nodes], 'indices': indices}})
+            mesh.append({'type': 'type', 'geometry': {'coordinates': np.round(nodes, 4).tolist(), 'indices': indices}})
 
         gdf = gpd.GeoDataFrame({'geometry': geometries, 'id': ids}, crs=3395)
 
@@ -736,7 +736,7 @@ class OSM:
 
             nodes = utils.from_2d_to_3d(nodes)
 
-            mesh.append({'type': poly['type'], 'geometry': {'coordinates': [round(item,4) for item in nodes], 'indices': indices}})
+            mesh.append({'type': poly['type'], 'geometry': {'coordinates': np.round(nodes, 4).tolist(), 'indices': indices}})
 
         gdf = gpd.GeoDataFrame({'geometry': geometries, 'id': ids}, crs=3395)
 
@@ -1109,7 +1109,7 @@ class OSM:
             if convert2dto3d:
                 nodes = utils.from_2d_to_3d(nodes)
 
-            mesh.append({'type': 'type', 'geometry': {'coordinates': [round(item,4) for item in nodes], 'indices': indices}})
+            mesh.append({'type': 'type', 'geometry': {'coordinates': np.round(nodes, 4).tolist(), 'indices': indices}})
         
         gdf = gpd.GeoDataFrame({'geometry': geometries, 'id': ids}, crs=3395)
 
@@ -1,47 +1,43 @@
-import pysolar
-import threading
 import pytz
-import struct
 
-import timezonefinder
 import math
 import numpy as np
 
 from datetime import datetime
 from datetime import timedelta
 
-import json
 import os
-import sys
+import tempfile
 
-if sys.platform != "darwin":
-    from plotoptix import NpOptiX
-    from plotoptix.geometry import PinnedBuffer
+from concurrent.futures import ProcessPoolExecutor
+
+from .layer_view import open_layer
+from .shadow_backends import create_shadow_backend, compute_angle, rays_hit_boxes, RAY_OFFSET
+from .layer_io import gather_indices, write_abstract_layer
+from .solar_position import timezone_at, solar_position, sun_directions
+from .visibility_cube import VisibilityCube
 
 class ShadowAccumulator:
     '''
         Calculate shadow accumulation considering meshes stored in json files.
     '''
 
-    filespaths = []
-    # start = None
-    # end = None
-    intervals = [] # list of lists containing different time intervals
-
-    flat_coords = []
-    coords = np.array([])
-    indices = np.array([])
-    ids = np.array([])
-    normals = np.array([])
-    ids_per_structure = [] # the ids are local per structure. They have to be globalized later
-    coords_per_file = [] # stores the number of coordinates per file to write the shadow data back to the correct files
-    coords_before_transformation = []
-    per_face_avg_accum = []
-    latitude = 0
-    longitude = 0
-    result_to_write = {} # the result that will be outputed in the files (groupped by interval index)
-
-    def __init__(self, latitude, longitude, filespaths, intervals):
+    '''
+        Number of chunks of timestamps per worker in time-parallel runs
+    '''
+    CHUNKS_PER_WORKER = 4
+
+    '''
+        Default lowest sun altitude (degrees) used to size the halo of tiled runs
+    '''
+    MIN_ALTITUDE = 5
+
+    '''
+        Minutes between the timestamps of accumulate_shadow (unit of the accumulation of adaptive runs)
+    '''
+    NSKIP = 15
+
+    def __init__(self, latitude, longitude, filespaths, intervals, backend=None, backend_options=None, visibility=None, workers=None, tile_size=None, min_altitude=None, cell_samples=None, angular_tolerance=None):
 
         '''
             All meshes must be 3D
@@ -49,8 +45,20 @@ class ShadowAccumulator:
             * @param {List[string]} filespaths All the layers containing meshes that have to be considered in the shadow calculation
             * @param {string} start Timestamp of the beginning of the accumulation. Format: "%m/%d/%Y %H:%M". Example: "03/20/2015 10:00"
             * @param {string} end Timestamp of the end of the accumulation. Format: "%m/%d/%Y %H:%M". Example: "03/20/2015 11:01"
+            * @param {string} backend Ray casting backend: 'optix', 'cpu', 'shadowmap' (approximate, rasterized) or None to pick one automatically
+            * @param {dict} backend_options Keyword arguments of the backend. Example: {'texel_size': 0.5} for 'shadowmap'
+            * @param {string} visibility Path of a .json where the shadow of each vertex for each timestamp is stored as a VisibilityCube. None to skip it
+            * @param {int} workers Number of processes tracing different timestamps in parallel. None or 1 traces them in this process
+            * @param {float} tile_size Side (meters) of the tiles of a tiled run (see accumulate_tiles). None traces all meshes at once
+            * @param {float} min_altitude Lowest sun altitude (degrees) considered when sizing the halo of the tiles. If None MIN_ALTITUDE is used
+            * @param {int} cell_samples Number of rays cast per cell (see sample_cells). None casts one ray per vertex
+            * @param {float} angular_tolerance Degrees the sun moves between two timestamps of an adaptive run (see adaptive_times). None traces one timestamp every NSKIP minutes
         '''
 
+        # all the state belongs to the instance, so several accumulators can run in the same process (threads) at the same time
+
+        self.intervals = [] # list of lists containing different time intervals
+
         for interval in intervals:
             start = datetime.strptime(interval[0], "%m/%d/%Y %H:%M")
             end = datetime.strptime(interval[1], "%m/%d/%Y %H:%M")
@@ -63,6 +71,34 @@ class ShadowAccumulator:
 
         self.latitude = latitude
         self.longitude = longitude
+        self.backend = backend # ray casting backend (see shadow_backends.SHADOW_BACKENDS). None picks OptiX if a GPU is available and the CPU otherwise
+        self.backend_options = backend_options # keyword arguments of the backend
+        self.visibility = visibility # path of the .json of the visibility cube (shadow of each vertex for each timestamp). None to skip it
+        self.workers = workers # processes of time-parallel runs
+        self.tile_size = tile_size # side of the tiles of tiled runs
+        self.min_altitude = self.MIN_ALTITUDE if min_altitude == None else min_altitude
+        self.cell_samples = cell_samples # rays per cell of per-cell runs
+        self.angular_tolerance = angular_tolerance # sun motion between the timestamps of adaptive runs
+
+        self.per_face_avg_accum = []
+        self.result_to_write = {} # the result that will be outputed in the files (groupped by interval index)
+
+        self.reset_geometry()
+
+    def reset_geometry(self):
+        '''
+            Clears the meshes loaded by load_files
+        '''
+
+        self.flat_coords = []
+        self.coords = np.array([])
+        self.indices = np.array([])
+        self.ids = np.array([])
+        self.normals = np.array([])
+        self.ids_per_structure = [] # the ids are local per structure. They have to be globalized later
+        self.coords_per_file = [] # stores the number of coordinates per file to write the shadow data back to the correct files
+        self.bboxes_per_file = [] # bounding box of each feature per file (used by incremental runs)
+        self.coords_before_transformation = []
 
     def computeVector(self, alt, azm):
         alt = math.pi*alt/180.0
@@ -78,160 +114,301 @@ class ShadowAccumulator:
         return [x/nrm,y/nrm,z/nrm]
 
     def computeAngle(self, vec1, vec2):
-        # temporary fix for [0,0,0] normals TODO
-        if vec1[0] == 0 and vec1[1] == 0 and vec1[2] == 0:
-            vec1 = np.array([0.0,0.0,1.0])
+        return compute_angle(vec1, vec2)
+
+    # UTC timestamps every nskip minutes between start and end
+    def compute_times(self, start, end, lat, lng, nskip=1):
+
+        tz = timezone_at(lat, lng)
+        start = tz.localize(start)
+        end = tz.localize(end)
+
+        # the timestamps are start+delta, start+2*delta, ... until end is reached (offset of start kept throughout the interval)
+        delta = timedelta(minutes=nskip)
+        steps = max(math.ceil((end - start) / delta), 0)
 
-        unit_vector_1 = vec1 / np.linalg.norm(vec1)
-        unit_vector_2 = vec2 / np.linalg.norm(vec2)
-        dot_product = np.dot(unit_vector_1, unit_vector_2)
-        angle = np.arccos(dot_product) * 180.0 / math.pi #degrees)
+        start_utc = np.datetime64(start.astimezone(pytz.utc).replace(tzinfo=None), 'ns')
 
-        return angle
+        return start_utc + np.arange(1, steps+1) * np.timedelta64(nskip*60, 's')
 
     # computer all directions of sun every nskip between start and end
     def compute_directions(self, start, end, lat, lng, nskip=1):
 
-        tf = timezonefinder.TimezoneFinder()
-        tz = tf.timezone_at(lng=lng, lat=lat)
-        tz = pytz.timezone(tz)
-        start = tz.localize(start)
-        end = tz.localize(end)
+        times = self.compute_times(start, end, lat, lng, nskip)
+
+        alt, azm = solar_position(times, lat, lng) # angle between the sun and a plane tangent to the earth at lat/lng, azimuth from north
+
+        return sun_directions(alt, azm)
+
+    def adaptive_times(self, intervals, lat, lng, nskip=1):
+        '''
+            Timestamps of an adaptive run. The minutes of the intervals with the sun above the horizon are grouped in segments along which
+            the sun moves at most angular_tolerance degrees. Each segment is traced once (at its middle minute) and weighted by its duration,
+            so the accumulation is still measured in steps of nskip minutes while the night and the slow parts of the day cost nothing.
+
+            * @param {List[List[datetime]]} intervals Start and end of each interval
+            * @param {int} nskip Minutes of a step of the accumulation
+            * @returns {Tuple[np.ndarray]} UTC timestamps, (timestamps, intervals) weight of each timestamp in each interval and duration of the segment of each timestamp (in steps of nskip minutes)
+        '''
+
+        minutes = [self.compute_times(start, end, lat, lng, 1) for start, end in intervals]
+        fine = np.unique(np.concatenate(minutes)) if len(minutes) > 0 else np.array([], dtype='datetime64[ns]')
+
+        alt, azm = solar_position(fine, lat, lng)
+        day = alt > 0
+
+        fine_membership = np.stack([np.isin(fine, interval_minutes) for interval_minutes in minutes], axis=1)[day] if len(minutes) > 0 else np.zeros((0, 0))
+        fine = fine[day]
+
+        if(len(fine) == 0):
+            return fine, np.zeros((0, len(intervals))), np.zeros(0)
 
-        directions = []
+        directions = sun_directions(alt[day], azm[day])
 
-        curr = start
-        until = end
-        delta=timedelta(minutes=nskip)
-        directions = []
-        while curr < until:
-            curr += delta
-            alt = pysolar.solar.get_altitude(lat, lng, curr) # angle between the sun and a plane tangent to the earth at lat/lng
-            azm = (pysolar.solar.get_azimuth(lat, lng, curr))
-            ddir = self.computeVector(alt, azm)
-            directions.append(ddir)
-        return directions
+        # consecutive minutes of daylight. Segments never cross the night or the gaps between intervals
+        new_run = np.concatenate(([True], np.diff(fine) != np.timedelta64(60, 's')))
+        run = np.cumsum(new_run) - 1
 
-    class params:
-        done = threading.Event()
-        k = 0
+        # angle travelled by the sun since the beginning of the run
+        step = np.concatenate(([0.0], np.degrees(np.arccos(np.clip(np.sum(directions[1:] * directions[:-1], axis=1), -1, 1)))))
+        step[new_run] = 0
+
+        travelled = np.cumsum(step)
+        travelled = travelled - travelled[new_run][run]
+
+        bins = np.floor(travelled / self.angular_tolerance).astype(np.int64)
+
+        new_segment = new_run | np.concatenate(([True], bins[1:] != bins[:-1]))
+        segment = np.cumsum(new_segment) - 1
+
+        starts = np.nonzero(new_segment)[0]
+        counts = np.bincount(segment)
+
+        weights = np.stack([np.bincount(segment, weights=fine_membership[:, index], minlength=len(starts)) for index in range(len(intervals))], axis=1) / nskip
+
+        return fine[starts + counts // 2], weights, counts / nskip
 
     # computes the shadow accumulation 
     def compute(self, directions, coords, indices, normals):
-        def done(rt: NpOptiX) -> None:
-            self.params.k += 1
-            self.params.done.set()
-
-        camera_plane_dim = math.ceil(math.sqrt(coords.shape[0]))
-        width = camera_plane_dim # camera plane width
-        height = camera_plane_dim # camera plane height
 
         accumulation = np.full((coords.shape[0], 1), 0) 
 
-        rt = NpOptiX(width=width, height=height)
-        rt.set_mesh('buildings', pos=coords, faces=indices, normals=normals)#, c=colors)
-        rt.set_float("scene_epsilon", 0.01) # set shader variable with a given name
-        rt.set_param(min_accumulation_step=1, max_accumulation_frames=1) # set raytracer parameter(s)
-        rt.set_accum_done_cb(done)
-        rt.start()
-
-        for direction in directions:
-            
-            with PinnedBuffer(rt.geometry_data['buildings'], 'Positions') as P:
-                n = math.ceil(math.sqrt(len(P)))
-                eye = np.zeros((n,n,4), dtype=np.float32) 
-
-                eyeRow = -1
-                for index, elem in enumerate(P):
-                    if(index%n == 0):
-                        eyeRow += 1
-                    eye[eyeRow,index%n,:3] = elem + 1e-1 * normals[index]
-    
-                rt.set_texture_2d('eye', eye, refresh=True)
-
-            with PinnedBuffer(rt.geometry_data['buildings'], 'Vectors') as N: 
-                n = len(normals)
-
-                rdir_temp = []
-                for i in range(0, n):
-                    normal = normals[i]
-                    ang = self.computeAngle(normal, direction)
-                    if ang > 90.0:
-                        rdir_temp.append([0,0,0,0])
-                    else:
-                        rdir_temp.append([direction[0],direction[1],direction[2],-1])
-                rdir_temp = np.array(rdir_temp, dtype=np.float32)
-
-                n = math.ceil(math.sqrt(len(rdir_temp)))
-                rdir = np.zeros((n,n,4), dtype=np.float32) 
-
-                rdirRow = -1
-                for index, elem in enumerate(rdir_temp):
-                    if(index%n == 0):
-                        rdirRow += 1
-                    rdir[rdirRow,index%n, :] = elem
-
-
-                rt.set_texture_2d('dir', rdir, refresh=True)
-
-            self.params.done.clear() # resetting the thread flag       
-            rt.setup_camera('cam2', cam_type='CustomProjXYZtoDir', textures=['eye', 'dir'], make_current=True) # two 4D textures are defined ([height, width, 4]). 'eye' is composed of origin points ([x, y, z, 0]). 'dir' is composed of ray directions and maximum ranges ([cosx, cosy, cosz, r]).
-
-            self.params.done.wait() # wait for the ray tracer to finish
-            
-            dist = rt._hit_pos[:,:,3].reshape(rt._height, rt._width) # _hit_pos shape: (height, width, 4). This 4 refers to [X, Y, Z, D], where XYZ is the hit 3D position and D is the hit distance to the camera plane. We are only interested in the D.
-            dist = [item for sublist in dist for item in sublist] # flattening distance 
-            dist = dist[:coords.shape[0]] # dropping extra points in the end of the matrix 
-            dist = np.array(dist) 
-
-            dist[dist < 0xFFFFFFFF] = 1
-            dist[dist > 0xFFFFFFFF] = 0
-
-            accumulation[:,0] = accumulation[:,0]+dist
-
-        # rt.close()
+        backend = create_shadow_backend(coords, indices, normals, self.backend, self.backend_options)
+
+        try:
+            for direction in directions:
+                accumulation[:,0] = accumulation[:,0]+backend.occlusion(direction)
+        finally:
+            backend.close()
 
         return accumulation
 
-    def per_face_avg(self, accumulation, indices, ids, ids_per_buildings):
+    def accumulate_intervals(self, intervals, lat, lng, coords, indices, normals, nskip=1, previous=None, changed=None, traced=None, samples=None):
+        '''
+            Shadow accumulation of several (possibly overlapping) intervals in a single pass. Each distinct timestamp of the union of the intervals is
+            traced once and its hits are added to every interval that contains it
+
+            * @param {List[List[datetime]]} intervals Start and end of each interval
+            * @param {string} previous Path of the visibility cube of a previous run over the same intervals. Only the rays affected by the edited geometry are traced again
+            * @param {dict} changed Ids of the features edited since the previous run per layer ({filepath: [ids]})
+            * @param {np.ndarray} traced Indices of the vertices whose rays are cast (the others are not accumulated). None casts the rays of all vertices
+            * @param {Tuple[np.ndarray]} samples (points, normals) the rays are cast from instead of the vertices (see sample_cells). None casts one ray per vertex
+            * @returns {np.ndarray} (coords, intervals) accumulation. (samples, intervals) if samples are given. Adaptive runs accumulate (fractional) steps of nskip minutes
+        '''
+
+        rays = coords.shape[0] if samples == None else len(samples[0])
+
+        accumulation = np.zeros((rays, len(intervals)), dtype=np.int64 if self.angular_tolerance == None else np.float64)
+
+        if(len(intervals) == 0):
+            return accumulation
+
+        durations = None # duration of each timestamp (in steps of nskip minutes). None if every timestamp is one step
+
+        if(self.angular_tolerance == None):
+            times = [self.compute_times(start, end, lat, lng, nskip) for start, end in intervals]
+            unique_times = np.unique(np.concatenate(times))
+
+            membership = np.stack([np.isin(unique_times, interval_times) for interval_times in times], axis=1) # (timestamps, intervals)
+        else:
+            unique_times, membership, durations = self.adaptive_times(intervals, lat, lng, nskip) # (timestamps, intervals) weights
+
+        alt, azm = solar_position(unique_times, lat, lng)
+        directions = sun_directions(alt, azm)
+
+        if(samples != None and (previous != None or self.visibility != None)):
+            raise Exception("Per-cell runs do not support visibility cubes")
+
+        reuse = None
+        if(previous != None):
+            reuse = self.reuse_previous(previous, unique_times, changed)
+            reuse += (self.coords_before_transformation + RAY_OFFSET * np.asarray(normals, dtype=np.float64).reshape(-1, 3),) # origins in the same frame as the boxes
+
+        cube = None
+        if(self.visibility != None):
+            if(previous != None and os.path.abspath(previous) == os.path.abspath(self.visibility)):
+                raise Exception("The visibility cube of an incremental run must be stored in a different file than the previous one")
+
+            feature_sizes = np.concatenate([np.asarray(counts, dtype=np.int64) for counts in self.coords_per_file]) if len(self.coords_per_file) > 0 else np.zeros(0)
+            bboxes = np.concatenate(self.bboxes_per_file) if len(self.bboxes_per_file) > 0 else np.zeros((0, 6))
+
+            cube = VisibilityCube.create(self.visibility, unique_times, coords.shape[0], lat, lng, self.filespaths, [sum(counts) for counts in self.coords_per_file], bboxes, feature_sizes, [len(counts) for counts in self.coords_per_file], durations)
+
+        rows = np.arange(len(directions))
+
+        if(self.workers == None or self.workers <= 1 or len(directions) <= 1):
+            backend = create_shadow_backend(coords, indices, normals, self.backend, self.backend_options, samples)
+
+            try:
+                accumulation += _trace_rows(backend, rows, directions, membership, rays, cube, reuse, traced)
+            finally:
+                backend.close()
+
+                if(cube != None):
+                    cube.flush()
+
+            return accumulation
+
+        if(self.backend == 'optix'):
+            raise Exception("The OptiX backend does not support time-parallel runs (workers > 1)")
+
+        # each worker loads the scene once from memory-mapped files and traces an interleaved subset of the timestamps (so day and night are balanced)
+        if(cube != None):
+            cube.flush()
+            cube = None
+
+        chunks = min(len(directions), self.workers * self.CHUNKS_PER_WORKER)
+
+        with tempfile.TemporaryDirectory() as scene_directory:
+            scene = {'coords': coords, 'indices': indices, 'normals': normals}
+
+            if(traced is not None):
+                scene['traced'] = traced
+
+            if(samples != None):
+                scene.update({'sample_points': samples[0], 'sample_normals': samples[1]})
+
+            if(reuse != None):
+                _, mapped, previous_vertices, retrace, boxes, origins = reuse
+                scene.update({'mapped': mapped, 'previous_vertices': previous_vertices, 'retrace': retrace, 'boxes': boxes, 'origins': origins})
+
+            for name, array in scene.items():
+                np.save(os.path.join(scene_directory, name+'.npy'), np.asarray(array))
+
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(scene_directory, self.backend, self.backend_options, self.visibility, previous, traced is not None, samples != None)) as executor:
+                chunk_rows = [rows[chunk::chunks] for chunk in range(chunks)]
+
+                for chunk_accumulation in executor.map(_trace_chunk, chunk_rows, [directions[r] for r in chunk_rows], [membership[r] for r in chunk_rows]):
+                    accumulation += chunk_accumulation
+
+        return accumulation
+
+    def reuse_previous(self, previous, times, changed=None):
+        '''
+            Matches the vertices of the loaded layers with the ones of a previous run. Feature ids must be stable between the runs
+            (features edited in place or appended to the layers).
+
+            * @param {string} previous Path of the visibility cube of the previous run
+            * @param {np.ndarray} times UTC timestamps of the current run
+            * @param {dict} changed Ids of the features edited since the previous run per layer ({filepath: [ids]})
+            * @returns {Tuple} (previous cube, vertices reused, their index in the previous cube, vertices to trace again for every direction, (k,6) boxes of the edited geometry)
+        '''
+
+        if(changed == None):
+            changed = {}
+
+        changed = {os.path.abspath(filepath): ids for filepath, ids in changed.items()}
+
+        cube = VisibilityCube.open(previous)
+        table = cube.feature_table()
+
+        if(table == None or len(self.bboxes_per_file) != len(self.filespaths)):
+            raise Exception("The previous visibility cube does not store the features of its layers")
+
+        if(not np.array_equal(cube.times, np.asarray(times, dtype='datetime64[s]'))):
+            raise Exception("The previous visibility cube was computed for different timestamps")
+
+        previous_bboxes, previous_sizes = table
+        previous_layers = cube.layer_offsets()
+
+        vertices = sum([sum(counts) for counts in self.coords_per_file])
+
+        mapped = []
+        previous_vertices = []
+        retrace = np.zeros(vertices, dtype=bool)
+        boxes = []
+
+        vertex = 0
+        for index, filepath in enumerate(self.filespaths):
+            sizes = np.asarray(self.coords_per_file[index], dtype=np.int64)
+            starts = np.cumsum(sizes) - sizes + vertex
+            layer_bboxes = self.bboxes_per_file[index]
+
+            key = os.path.abspath(filepath)
+
+            edited = np.zeros(len(sizes), dtype=bool)
+
+            if(key in previous_layers):
+                previous_vertex, _, previous_feature, previous_count = previous_layers.pop(key)
+
+                old_sizes = previous_sizes[previous_feature:previous_feature+previous_count]
+                old_starts = np.cumsum(old_sizes) - old_sizes + previous_vertex
+                old_bboxes = previous_bboxes[previous_feature:previous_feature+previous_count]
 
-        #make the ids global
-        global_ids = []
+                common = min(len(sizes), previous_count)
 
-        current_building = 0
-        read_ids = 0
-        offset = 0
-        for i in range(0,len(ids)):
-            if read_ids == ids_per_buildings[current_building]:
-                read_ids = 0
-                current_building += 1
-                offset = len(global_ids)
-            global_ids.append(ids[i]+offset)
-            read_ids += 1
+                ids = np.asarray(changed.get(key, []), dtype=np.int64)
+                edited[ids[ids < len(sizes)]] = True
+                edited[common:] = True # appended features
+                edited[:common] |= sizes[:common] != old_sizes[:common] # the vertices of the feature cannot be matched
 
-        avg_accumulation_triangle = np.zeros(len(indices))
-        avg_accumulation_cell = np.zeros(len(global_ids))
+                kept = np.nonzero(~edited[:common])[0]
+
+                mapped.append(gather_indices(starts[kept], sizes[kept]))
+                previous_vertices.append(gather_indices(old_starts[kept], sizes[kept]))
+
+                # where the edited and the removed features were
+                removed = np.ones(previous_count, dtype=bool)
+                removed[kept] = False
+                boxes.append(old_bboxes[removed])
+            else:
+                edited[:] = True
+
+            retrace[gather_indices(starts[edited], sizes[edited])] = True
+            boxes.append(layer_bboxes[edited])
+
+            vertex += int(sizes.sum())
+
+        # layers of the previous run that are not considered anymore
+        for previous_vertex, _, previous_feature, previous_count in previous_layers.values():
+            boxes.append(previous_bboxes[previous_feature:previous_feature+previous_count])
+
+        mapped = np.concatenate(mapped) if len(mapped) > 0 else np.zeros(0, dtype=np.int64)
+        previous_vertices = np.concatenate(previous_vertices) if len(previous_vertices) > 0 else np.zeros(0, dtype=np.int64)
+
+        boxes = np.concatenate(boxes).astype(np.float64) if len(boxes) > 0 else np.zeros((0, 6))
+        boxes = boxes[~np.isnan(boxes).any(axis=1)] # features without coordinates
+
+        return cube, mapped, previous_vertices, retrace, boxes
+
+    def per_face_avg(self, accumulation, indices, ids, ids_per_buildings):
+
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        ids_per_buildings = np.asarray(ids_per_buildings, dtype=np.int64).reshape(-1)
+
+        #make the ids global: shift the ids of each building by the number of ids before it
+        global_ids = ids + np.repeat(np.cumsum(ids_per_buildings) - ids_per_buildings, ids_per_buildings)
 
         # calculate acc by triangle
-        for i in range(0,len(indices)):
-            value = 0
-            for vid in indices[i]:
-                value += accumulation[int(vid)]
-            avg_accumulation_triangle[i] = value
+        accumulation = np.asarray(accumulation, dtype=np.float64).reshape(len(accumulation), -1)[:,0]
+        accumulation_triangle = accumulation[np.asarray(indices, dtype=np.int64).reshape(-1, 3)].sum(axis=1)
 
         # calculate acc by cell based on the triangles that compose it
-        count_acc_cell = np.zeros(len(global_ids))
-        for i in range(0, len(indices)):
-            cell = int(global_ids[i])       
-            avg_accumulation_cell[cell] += avg_accumulation_triangle[i]
-            count_acc_cell[cell] += 1
+        accumulation_cell = np.bincount(global_ids, weights=accumulation_triangle, minlength=len(global_ids))
+        count_acc_cell = np.bincount(global_ids, minlength=len(global_ids))
 
         # distribute the average of the cell to the triangles that compose it
-        for i in range(0, len(indices)):
-            cell = int(global_ids[i])       
-            avg_accumulation_triangle[i] = avg_accumulation_cell[cell]/count_acc_cell[cell]    
-
-        return np.array(avg_accumulation_triangle)
+        return accumulation_cell[global_ids]/count_acc_cell[global_ids]
 
     def accumulate(self, start, end, lat, lng, coords, indices, normals, nskip=1):
         directions = self.compute_directions(start, end, lat, lng, nskip)
@@ -246,199 +423,289 @@ class ShadowAccumulator:
 
         avg_accumulation_per_coordinates = np.zeros(len(coords), dtype=np.float32) 
 
-        for index, elem in enumerate(avg_accumulation_triangle):
-            avg_accumulation_per_coordinates[indices[index][0]] = elem
-            avg_accumulation_per_coordinates[indices[index][1]] = elem
-            avg_accumulation_per_coordinates[indices[index][2]] = elem
+        avg_accumulation_per_coordinates[np.asarray(indices, dtype=np.int64).reshape(-1, 3)] = np.asarray(avg_accumulation_triangle, dtype=np.float32).reshape(-1, 1)
 
-        return np.array(avg_accumulation_per_coordinates)
+        return avg_accumulation_per_coordinates
 
-    def save(self):
+    def sample_cells(self, coords, indices, normals, ids, ids_per_buildings, samples=1):
         '''
-            Writes the shadow data back to the mesh files passed to the constructor
+            Ray origins of a per-cell run. With one sample the ray of a cell starts at the area-weighted centroid of its triangles. With k samples
+            the rays start at k points spread over the triangles of the cell proportionally to their area (fixed seed, so runs are reproducible).
+            All rays of a cell use its area-weighted mean normal.
+
+            * @param {np.ndarray} ids Cell of each triangle (local per structure)
+            * @param {np.ndarray} ids_per_buildings Number of triangles of each structure
+            * @param {int} samples Number of rays per cell
+            * @returns {Tuple[np.ndarray]} (points, normals, cell of each sample, cell of each triangle)
         '''
 
-        for index in range(len(self.intervals)):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+        triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
 
-            accumulation = self.result_to_write[index] # shadow data accumulated per coordinates
-            function_index = index
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        ids_per_buildings = np.asarray(ids_per_buildings, dtype=np.int64).reshape(-1)
 
-            # function values are the normalized accumulation values ([0,1]) that are used by the shader of utk-map to color the cells
-            if(max(accumulation) != 0):
-                function_values = accumulation/max(accumulation)
-            else:
-                function_values = accumulation
+        # same global ids of per_face_avg, renumbered so the cells are contiguous
+        global_ids = ids + np.repeat(np.cumsum(ids_per_buildings) - ids_per_buildings, ids_per_buildings)
+        _, cell_of_triangle = np.unique(global_ids, return_inverse=True)
+        cell_of_triangle = cell_of_triangle.reshape(-1)
 
-            function_values = function_values.tolist()
+        cells = cell_of_triangle.max()+1 if len(cell_of_triangle) > 0 else 0
 
-            flat_coords = self.flat_coords.copy()
+        corners = coords[triangles] # (triangles, 3, 3)
+        area = 0.5 * np.linalg.norm(np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0]), axis=1)
 
-            # decoupled abstract layer
-            # shadow_layer = {'id': "shadow"+str(function_index), 'coordinates': [round(item,4) for item in self.flat_coords], 'values': [round(item,4) for item in function_values]}
+        # degenerated cells (zero area) weight their triangles equally
+        cell_area = np.bincount(cell_of_triangle, weights=area, minlength=cells)
+        weights = np.where(cell_area[cell_of_triangle] > 0, area, 1.0)
+        cell_weight = np.bincount(cell_of_triangle, weights=weights, minlength=cells)
 
-            # directory = os.path.dirname(self.filespaths[0])
+        cell_normals = np.stack([np.bincount(cell_of_triangle, weights=weights * normals[triangles].mean(axis=1)[:,axis], minlength=cells) for axis in range(3)], axis=1)
+        norm = np.linalg.norm(cell_normals, axis=1, keepdims=True)
+        cell_normals = np.divide(cell_normals, norm, out=np.zeros_like(cell_normals), where=norm > 0)
 
-            # with open(os.path.join(directory, "shadow"+str(function_index)+".json"), "w") as outfile:
-            #     json.dump(shadow_layer, outfile)
+        if(samples <= 1):
+            centroids = np.stack([np.bincount(cell_of_triangle, weights=weights * corners.mean(axis=1)[:,axis], minlength=cells) for axis in range(3)], axis=1) / cell_weight[:, np.newaxis]
 
-            for index, geometries_count in enumerate(self.coords_per_file):
-                
-                fileName = os.path.splitext(os.path.basename(self.filespaths[index]))[0]
+            return centroids, cell_normals, np.arange(cells), cell_of_triangle
+
+        # triangles sorted by cell, so each cell picks its triangles by inverting the cumulative weight of its own range
+        order = np.argsort(cell_of_triangle, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        cell_end = np.cumsum(cell_weight)
+        cell_start = cell_end - cell_weight
+        last_triangle = np.cumsum(np.bincount(cell_of_triangle, minlength=cells)) - 1
 
-                directory = os.path.dirname(self.filespaths[index])
+        rng = np.random.default_rng(0)
 
-                function_values_this_file = []
-                flat_coords_this_file = []
+        sample_cell = np.repeat(np.arange(cells), samples)
+        u = (np.tile(np.arange(samples), cells) + rng.random(len(sample_cell))) / samples # stratified over the area of the cell
 
-                for geometry_count in geometries_count:
+        picked = np.minimum(np.searchsorted(cumulative, cell_start[sample_cell] + u * cell_weight[sample_cell], side='right'), last_triangle[sample_cell])
+        picked = order[picked]
 
-                    function_values_this_file += function_values[:geometry_count]
+        # uniform point inside each picked triangle
+        r1 = np.sqrt(rng.random(len(sample_cell)))[:, np.newaxis]
+        r2 = rng.random(len(sample_cell))[:, np.newaxis]
+        points = (1 - r1) * corners[picked,0] + r1 * (1 - r2) * corners[picked,1] + r1 * r2 * corners[picked,2]
 
-                    flat_coords_this_file += flat_coords[:geometry_count*3]
+        return points, cell_normals[sample_cell], sample_cell, cell_of_triangle
 
-                    flat_coords = flat_coords[geometry_count*3:] # remove the values that belong to the current mesh
-                    function_values = function_values[geometry_count:] # remove the values that belong to the current mesh
+    def accumulate_tiles(self, intervals, lat, lng, nskip=1):
+        '''
+            Shadow accumulation computed tile by tile, so only the geometry around one tile is in memory at a time.
+
+            Features are assigned to square tiles of tile_size meters by the center of their bounding box. Each tile is traced with the features
+            (occluders) whose bounding box is within a halo around the receivers of the tile: the height range of the scene divided by the tangent of
+            the lowest sun altitude (not lower than min_altitude). Shadows of sun positions lower than min_altitude are cut at the halo.
+
+            * @param {List[List[datetime]]} intervals Start and end of each interval
+            * @returns {np.ndarray} (coords, intervals) accumulation in the order of the vertices of load_files
+        '''
+
+        self.reset_geometry()
+
+        layers = [open_layer(filepath) for filepath in self.filespaths]
+
+        # feature tables (no geometry is read)
+        sizes = [layer.offsets('coordinates')[1] // 3 for layer in layers] # considers always a 3d mesh
+        self.coords_per_file = [layer_sizes.tolist() for layer_sizes in sizes]
+        self.bboxes_per_file = [np.array(layer.bboxes) for layer in layers]
+
+        file_starts = np.cumsum([layer_sizes.sum() for layer_sizes in sizes]) - np.array([layer_sizes.sum() for layer_sizes in sizes], dtype=np.int64)
+
+        feature_layer = np.concatenate([np.full(len(layer_sizes), index) for index, layer_sizes in enumerate(sizes)]).astype(np.int64)
+        feature_index = np.concatenate([np.arange(len(layer_sizes)) for layer_sizes in sizes]).astype(np.int64)
+        feature_sizes = np.concatenate(sizes).astype(np.int64)
+        feature_starts = np.concatenate([np.cumsum(layer_sizes) - layer_sizes + start for layer_sizes, start in zip(sizes, file_starts)]).astype(np.int64) # first vertex of each feature
+        boxes = np.concatenate(self.bboxes_per_file).astype(np.float64)
+
+        accumulation = np.zeros((int(feature_sizes.sum()), len(intervals)), dtype=np.int64 if self.angular_tolerance == None else np.float64)
+
+        valid = np.nonzero(~np.isnan(boxes).any(axis=1) & (feature_sizes > 0))[0]
+
+        if(len(intervals) == 0 or len(valid) == 0):
+            return accumulation
 
-                shadow_layer = {'id': "shadow"+str(function_index)+'_'+fileName, 'coordinates': [round(item,4) for item in flat_coords_this_file], 'values': [round(item,4) for item in function_values_this_file]}
+        # halo reached by the shadows of the tallest structures
+        times = np.unique(np.concatenate([self.compute_times(start, end, lat, lng, nskip) for start, end in intervals]))
+        altitudes, _ = solar_position(times, lat, lng)
 
-                with open(os.path.join(directory, "shadow"+str(function_index)+'_'+fileName+".json"), "w") as outfile:
-                    json.dump(shadow_layer, outfile)
+        lowest = max(altitudes[altitudes > 0].min() if np.any(altitudes > 0) else 90.0, self.min_altitude)
+        halo = (boxes[valid, 5].max() - boxes[valid, 2].min()) / math.tan(math.radians(lowest))
 
-    def accumulate_shadow(self):
+        centers = (boxes[valid, :2] + boxes[valid, 3:5]) / 2
+        tile_keys = np.floor((centers - centers.min(axis=0)) / self.tile_size).astype(np.int64)
+        _, tile_of_feature = np.unique(tile_keys, axis=0, return_inverse=True)
+        tile_of_feature = tile_of_feature.reshape(-1)
+
+        for tile in range(tile_of_feature.max()+1):
+            receivers = valid[tile_of_feature == tile]
+
+            region_min = boxes[receivers, :2].min(axis=0) - halo
+            region_max = boxes[receivers, 3:5].max(axis=0) + halo
+
+            occluders = valid[np.all((boxes[valid, :2] <= region_max) & (boxes[valid, 3:5] >= region_min), axis=1)] # sorted by layer and feature (contains the receivers)
+
+            coords, indices, normals = self.load_features(layers, feature_layer[occluders], feature_index[occluders])
+
+            # only the rays of the receivers are cast. The occluders are receivers of their own tile
+            is_receiver = np.repeat(np.isin(occluders, receivers), feature_sizes[occluders])
+
+            tile_accumulation = self.accumulate_intervals(intervals, lat, lng, coords - np.mean(coords, axis=0), indices, normals, nskip, traced=np.nonzero(is_receiver)[0])
+
+            accumulation[gather_indices(feature_starts[receivers], feature_sizes[receivers])] = tile_accumulation[is_receiver]
+
+        return accumulation
+
+    def load_features(self, layers, feature_layer, feature_index):
         '''
-            Accumulate shadow over a period of time considering the parameters defined in the constructor
+            Mesh of a subset of the features of the layers (in the given order)
+
+            * @param {List[LayerView]} layers Layers of the run
+            * @param {np.ndarray} feature_layer Layer of each feature
+            * @param {np.ndarray} feature_index Index of each feature in its layer
+            * @returns {Tuple[np.ndarray]} (coords, indices, normals)
         '''
 
-        self.load_files()
+        coords = []
+        indices = []
+        normals = []
 
-        self.flat_coords = [float(elem) for sublist in self.coords_before_transformation for elem in sublist]
+        vertices = 0
 
-        for index, interval in enumerate(self.intervals):
-            accum = self.accumulate(interval[0], interval[1], self.latitude, self.longitude, self.coords, self.indices, self.normals, 15)
+        for index, layer in enumerate(layers):
+            selected = feature_index[feature_layer == index]
 
-            self.per_face_avg_accum = self.per_face_avg(accum, self.indices, self.ids, self.ids_per_structure) # accumulation per triangle
+            if(len(selected) == 0):
+                continue
 
-            max = -1
-            min = -1
+            geometry = {}
+            for element in ['coordinates', 'indices', 'normals']:
+                starts, sizes = layer.offsets(element)
+                geometry[element] = (np.asarray(layer.values(element)[gather_indices(starts[selected], sizes[selected])]), sizes[selected])
 
-            for elem in accum:
+            coordinates_sizes = geometry['coordinates'][1] // 3 # considers always a 3d mesh
+            vertices_before = np.cumsum(coordinates_sizes) - coordinates_sizes + vertices
 
-                if max == -1:
-                    max = elem[0]
+            coords.append(geometry['coordinates'][0].astype(np.float64).reshape(-1, 3))
+            indices.append((geometry['indices'][0].astype(np.int64) + np.repeat(vertices_before, geometry['indices'][1])).reshape(-1, 3))
+            normals.append(geometry['normals'][0].reshape(-1, 3))
 
-                if min == -1:
-                    min = elem[0]
+            vertices += int(coordinates_sizes.sum())
 
-                if elem[0] > max:
-                    max = elem[0]
+        return np.concatenate(coords), np.concatenate(indices), np.concatenate(normals)
 
-                if elem[0] < min:
-                    min = elem[0]
- 
-            self.result_to_write[index] =  [(elem[0] - min) / (max - min) for elem in accum]
+    def save(self):
+        '''
+            Writes the shadow data back to the mesh files passed to the constructor
+        '''
 
-    def load_files(self):
+        for index in range(len(self.intervals)):
 
-        for filepath in self.filespaths:
+            accumulation = np.asarray(self.result_to_write[index]) # shadow data accumulated per coordinates
+            function_index = index
 
-            file = open(filepath, mode='r')
-            file_content = json.loads(file.read())
+            # function values are the normalized accumulation values ([0,1]) that are used by the shader of utk-map to color the cells
+            if(len(accumulation) > 0 and accumulation.max() != 0):
+                function_values = accumulation/accumulation.max()
+            else:
+                function_values = accumulation
 
-            directory = os.path.dirname(filepath)
-            # file name with extension
-            file_name = os.path.basename(filepath)
-            # file name without extension
-            file_name_wo_extension = os.path.splitext(file_name)[0]
+            # first and last vertex of each file
+            bounds = np.concatenate(([0], np.cumsum([sum(geometries_count) for geometries_count in self.coords_per_file])))
 
-            coordinates = []
-            normals = []
-            indices = []
-            ids = []
+            for index, filepath in enumerate(self.filespaths):
+                
+                fileName = os.path.splitext(os.path.basename(filepath))[0]
 
-            if('coordinates' in file_content['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_coordinates.data'), "rb")
+                directory = os.path.dirname(filepath)
 
-                data = f.read()
+                coordinates = open_layer(filepath).coordinates # same order of the vertices of load_files (also in tiled runs, which do not keep all the meshes in memory)
 
-                unpacked_data = struct.iter_unpack('d', data)
+                # decoupled abstract layer with binary coordinates and values (see layer_io.write_abstract_layer)
+                write_abstract_layer(os.path.join(directory, "shadow"+str(function_index)+'_'+fileName+".json"), coordinates, function_values[bounds[index]:bounds[index+1]], "shadow"+str(function_index)+'_'+fileName)
 
-                for elem in unpacked_data:
-                    coordinates.append(elem[0])
+    def accumulate_shadow(self, previous=None, changed=None):
+        '''
+            Accumulate shadow over a period of time considering the parameters defined in the constructor
 
-                f.close()
-            if('normals' in file_content['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_normals.data'), "rb")
+            * @param {string} previous Path of the visibility cube of a previous run (same intervals). Only the rays affected by the edited features are traced again
+            * @param {dict} changed Ids of the features edited since the previous run per layer ({filepath: [ids]}). Appended features and new layers are detected automatically
+        '''
 
-                data = f.read()
+        if(self.tile_size != None):
+            if(previous != None or self.visibility != None):
+                raise Exception("Tiled runs do not support visibility cubes")
 
-                unpacked_data = struct.iter_unpack('f', data)
+            if(self.cell_samples != None):
+                raise Exception("Tiled runs do not support per-cell sampling")
 
-                for elem in unpacked_data:
-                    normals.append(elem[0])
+            accumulation = self.accumulate_tiles(self.intervals, self.latitude, self.longitude, self.NSKIP)
+        elif(self.cell_samples != None):
+            self.load_files()
 
-                f.close()
-            if('indices' in file_content['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_indices.data'), "rb")
+            self.flat_coords = self.coords_before_transformation.ravel()
 
-                data = f.read()
+            points, sample_normals, sample_cell, cell_of_triangle = self.sample_cells(self.coords, self.indices, self.normals, self.ids, self.ids_per_structure, self.cell_samples)
 
-                unpacked_data = struct.iter_unpack('I', data)
+            sample_accumulation = self.accumulate_intervals(self.intervals, self.latitude, self.longitude, self.coords, self.indices, self.normals, self.NSKIP, previous, changed, samples=(points, sample_normals))
 
-                for elem in unpacked_data:
-                    indices.append(elem[0])
+            # average over the samples of each cell, written straight to the triangles of the cell and then to their vertices
+            cell_accumulation = np.zeros((len(sample_normals) // max(self.cell_samples, 1), len(self.intervals)))
+            np.add.at(cell_accumulation, sample_cell, sample_accumulation)
+            cell_accumulation /= max(self.cell_samples, 1)
 
-                f.close()
-            if('ids' in file_content['data'][0]['geometry']):
-                f = open(os.path.join(directory,file_name_wo_extension+'_ids.data'), "rb")
+            accumulation = np.zeros((self.coords.shape[0], len(self.intervals)))
+            for index in range(len(self.intervals)):
+                accumulation[:, index] = self.per_coordinates_avg(cell_accumulation[cell_of_triangle, index], self.coords, self.indices)
+        else:
+            self.load_files()
 
-                data = f.read()
+            self.flat_coords = self.coords_before_transformation.ravel()
 
-                unpacked_data = struct.iter_unpack('I', data)
+            accumulation = self.accumulate_intervals(self.intervals, self.latitude, self.longitude, self.coords, self.indices, self.normals, self.NSKIP, previous, changed)
 
-                for elem in unpacked_data:
-                    ids.append(elem[0])
+        for index in range(len(self.intervals)):
+            accum = accumulation[:, index:index+1]
 
-                f.close()
+            if(self.tile_size == None):
+                # per-cell runs hold the cell value in every vertex of the cell, so both modes share the same reduction (and scale)
+                self.per_face_avg_accum = self.per_face_avg(accum, self.indices, self.ids, self.ids_per_structure) # accumulation per triangle
 
-            for i in range(len(file_content['data'])):
+            accum = accum[:,0].astype(np.float64)
 
-                if(len(coordinates) > 0):
-                    startAndSize = file_content['data'][i]['geometry']['coordinates']
-                    file_content['data'][i]['geometry']['coordinates'] = coordinates[startAndSize[0]:startAndSize[0]+startAndSize[1]]
+            # normalized accumulation ([0,1]). Zero everywhere if all vertices have the same accumulation
+            if(len(accum) > 0 and accum.max() > accum.min()):
+                self.result_to_write[index] = (accum - accum.min()) / (accum.max() - accum.min())
+            else:
+                self.result_to_write[index] = np.zeros(len(accum))
 
-                if(len(indices) > 0):
-                    startAndSize = file_content['data'][i]['geometry']['indices']
-                    file_content['data'][i]['geometry']['indices'] = indices[startAndSize[0]:startAndSize[0]+startAndSize[1]]
+    def load_files(self):
 
-                if(len(normals) > 0):
-                    startAndSize = file_content['data'][i]['geometry']['normals']
-                    file_content['data'][i]['geometry']['normals'] = normals[startAndSize[0]:startAndSize[0]+startAndSize[1]]
+        self.reset_geometry()
 
-                if(len(ids) > 0):
-                    startAndSize = file_content['data'][i]['geometry']['ids']
-                    file_content['data'][i]['geometry']['ids'] = ids[startAndSize[0]:startAndSize[0]+startAndSize[1]]
+        for filepath in self.filespaths:
 
-            file_coords = []
-            file_indices = []
-            file_ids = []
-            file_normals = []
+            layer = open_layer(filepath)
 
-            self.coords_per_file.append([])
+            _, coordinates_sizes = layer.offsets('coordinates')
+            _, indices_sizes = layer.offsets('indices')
+            _, ids_sizes = layer.offsets('ids')
 
-            for element in file_content['data']:
-                file_indices += [int(item)+int(len(file_coords)/3)+self.coords.shape[0] for item in element['geometry']['indices']] # concat in the end of the list # considers always a 3d mesh
-                file_coords += element['geometry']['coordinates'] # concat in the end of the list
-                file_ids += element['geometry']['ids'] # concat in the end of the list
-                file_normals += element['geometry']['normals'] # concat in the end of the list
+            # indices are local to each structure. Shift them by the number of vertices before the structure
+            vertices_before = (np.cumsum(coordinates_sizes) - coordinates_sizes) // 3 # considers always a 3d mesh
 
-                self.ids_per_structure.append(len(element['geometry']['ids']))
+            file_coords = np.array(layer.coordinates, dtype=np.float64).reshape(-1, 3) # considers always a 3d mesh
+            file_indices = (layer.indices.astype(np.int64) + np.repeat(vertices_before, indices_sizes) + self.coords.shape[0]).reshape(-1, 3) # considers always a 3d mesh
+            file_ids = layer.ids.astype(np.int64)
+            file_normals = np.array(layer.normals).reshape(-1, 3) # considers always a 3d mesh
 
-                self.coords_per_file[-1].append(int(len(element['geometry']['coordinates'])/3)) # considers always a 3d mesh
+            self.ids_per_structure += ids_sizes.tolist()
 
-            file_coords = np.reshape(np.array(file_coords), (int(len(file_coords)/3), -1)) # considers always a 3d mesh
-            file_indices = np.reshape(np.array(file_indices), (int(len(file_indices)/3), -1)) # considers always a 3d mesh
-            file_ids = np.array(file_ids)
-            file_normals = np.reshape(np.array(file_normals), (int(len(file_normals)/3), -1)) # considers always a 3d mesh
+            self.coords_per_file.append((coordinates_sizes // 3).tolist()) # considers always a 3d mesh
+            self.bboxes_per_file.append(np.array(layer.bboxes))
 
             if len(self.coords) == 0:
                 self.coords = np.copy(file_coords)
@@ -460,8 +727,6 @@ class ShadowAccumulator:
             else:
                 self.normals = np.concatenate((self.normals, file_normals), axis=0)
 
-            file.close()
-
         self.ids_per_structure = np.array(self.ids_per_structure)
 
         self.coords_before_transformation = np.copy(self.coords)
@@ -489,4 +754,86 @@ class ShadowAccumulator:
     #     # vplt += pts_hit_pos.clone()
     #     # vplt += arrows_normals.clone()
     #     # vplt += arrows_rdir.clone()
-    #     vplt.show(viewup='z', zoom=1.3)
\ No newline at end of file
+    #     vplt.show(viewup='z', zoom=1.3)
+
+def _trace_rows(backend, rows, directions, membership, vertices, cube=None, reuse=None, traced=None):
+    '''
+        Accumulation of a subset of the timestamps of a run
+
+        * @param {ShadowBackend} backend Backend of the scene
+        * @param {np.ndarray} rows Index of each timestamp in the run (row of the visibility cubes)
+        * @param {np.ndarray} directions Sun direction of each timestamp
+        * @param {np.ndarray} membership (timestamps, intervals) intervals that contain each timestamp (or weight of each timestamp in each interval)
+        * @param {int} vertices Number of vertices of the scene
+        * @param {VisibilityCube} cube Cube where the shadow of each timestamp is written. None to skip it
+        * @param {Tuple} reuse (previous cube, vertices reused, their index in the previous cube, vertices to trace again, boxes of the edited geometry, ray origins) of an incremental run
+        * @param {np.ndarray} traced Indices of the vertices whose rays are cast. None casts the rays of all vertices
+        * @returns {np.ndarray} (vertices, intervals) accumulation
+    '''
+
+    accumulation = np.zeros((vertices, membership.shape[1]), dtype=np.float64 if membership.dtype.kind == 'f' else np.int64)
+
+    for row, direction, intervals_in in zip(rows, directions, membership):
+
+        if(reuse == None):
+            hits = np.asarray(backend.occlusion(direction, traced), dtype=np.int64)
+        else:
+            cube_previous, mapped, previous_vertices, retrace, boxes, origins = reuse
+
+            hits = np.zeros(vertices, dtype=np.int64)
+            hits[mapped] = cube_previous.row(row)[previous_vertices]
+
+            # rays of new or edited vertices and rays crossing the space occupied by the edited geometry before or after the edit
+            affected = np.nonzero(retrace | rays_hit_boxes(origins, direction, boxes))[0]
+
+            hits[affected] = np.asarray(backend.occlusion(direction, affected), dtype=np.int64)[affected]
+
+        accumulation += hits[:, np.newaxis] * intervals_in
+
+        if(cube != None):
+            cube.write(row, hits)
+
+    return accumulation
+
+'''
+    State of the worker processes of a time-parallel run
+'''
+_worker_run = None
+
+def _init_worker(scene_directory, backend, backend_options, visibility, previous, traced, sampled=False):
+    global _worker_run
+
+    def load(name):
+        return np.load(os.path.join(scene_directory, name+'.npy'), mmap_mode='r')
+
+    coords = load('coords')
+
+    options = dict(backend_options) if backend_options != None else {}
+
+    # the parallelism is over time, so the CPU backend traces the rays of each timestamp in the worker itself
+    if(backend == None or backend == 'cpu'):
+        backend = 'cpu'
+        options['workers'] = 1
+
+    reuse = None
+    if(previous != None):
+        reuse = (VisibilityCube.open(previous), load('mapped'), load('previous_vertices'), load('retrace'), load('boxes'), load('origins'))
+
+    samples = (load('sample_points'), load('sample_normals')) if sampled else None
+
+    _worker_run = {
+        'backend': create_shadow_backend(coords, load('indices'), load('normals'), backend, options, samples),
+        'vertices': coords.shape[0] if samples == None else len(samples[0]),
+        'cube': VisibilityCube.open(visibility, mode='r+') if visibility != None else None,
+        'reuse': reuse,
+        'traced': load('traced') if traced else None
+    }
+
+def _trace_chunk(rows, directions, membership):
+
+    accumulation = _trace_rows(_worker_run['backend'], rows, directions, membership, _worker_run['vertices'], _worker_run['cube'], _worker_run['reuse'], _worker_run['traced'])
+
+    if(_worker_run['cube'] != None):
+        _worker_run['cube'].flush()
+
+    return accumulation
@@ -0,0 +1,670 @@
+import abc
+import os
+import sys
+import math
+import threading
+import warnings
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+NpOptiX = None
+
+if sys.platform != "darwin":
+    try:
+        from plotoptix import NpOptiX
+    except Exception:
+        NpOptiX = None
+
+'''
+    Ray casting backends used by ShadowAccumulator.
+
+    A backend is created for a mesh (coords, indices, normals) and answers, for one sun direction at a time, which vertices are in shadow.
+    Rays start at each vertex moved 0.1 along its normal, or at the sample points given to the backend (e.g. one per cell) moved along their own normals. Vertices facing away from the sun (angle between normal and direction > 90 degrees) are not counted.
+'''
+
+RAY_OFFSET = 1e-1 # distance along the normal between a vertex and the origin of its ray
+SCENE_EPSILON = 0.01 # hits closer than this to the origin of the ray are ignored
+
+def compute_angle(vec1, vec2):
+    # temporary fix for [0,0,0] normals TODO
+    if vec1[0] == 0 and vec1[1] == 0 and vec1[2] == 0:
+        vec1 = np.array([0.0,0.0,1.0])
+
+    unit_vector_1 = vec1 / np.linalg.norm(vec1)
+    unit_vector_2 = vec2 / np.linalg.norm(vec2)
+    dot_product = np.dot(unit_vector_1, unit_vector_2)
+    angle = np.arccos(dot_product) * 180.0 / math.pi #degrees)
+
+    return angle
+
+def facing_sun(normals, direction):
+    '''
+        Vertices whose normal makes an angle of at most 90 degrees with direction. [0,0,0] normals are considered to point up
+    '''
+
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    dots = normals @ np.asarray(direction, dtype=np.float64)
+
+    zero = ~normals.any(axis=1)
+    dots[zero] = direction[2]
+
+    return dots >= 0
+
+def traced_vertices(normals, direction, vertices=None):
+    '''
+        Mask of the vertices whose ray is cast: the ones facing the sun, restricted to vertices if given
+    '''
+
+    traced = facing_sun(normals, direction)
+
+    if(vertices is not None):
+        subset = np.zeros(len(traced), dtype=bool)
+        subset[vertices] = True
+        traced &= subset
+
+    return traced
+
+def rays_hit_boxes(origins, direction, boxes, tmin=0):
+    '''
+        Rays (origin + t*direction, t >= tmin) that cross at least one box (slab test)
+
+        * @param {np.ndarray} origins (n,3) origins of the rays
+        * @param {List[float]} direction Direction shared by the rays
+        * @param {np.ndarray} boxes (k,6) boxes (minx, miny, minz, maxx, maxy, maxz)
+        * @returns {np.ndarray} Boolean mask of the rays
+    '''
+
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+
+    with np.errstate(divide='ignore'):
+        inverse = 1.0 / np.asarray(direction, dtype=np.float64)
+
+    hit = np.zeros(len(origins), dtype=bool)
+
+    for box in boxes:
+        with np.errstate(invalid='ignore'):
+            t1 = (box[:3] - origins) * inverse
+            t2 = (box[3:] - origins) * inverse
+
+        # nan appears when a ray parallel to a slab starts on its plane
+        near = np.nan_to_num(np.minimum(t1, t2), nan=-np.inf, posinf=np.inf, neginf=-np.inf).max(axis=1)
+        far = np.nan_to_num(np.maximum(t1, t2), nan=np.inf, posinf=np.inf, neginf=-np.inf).min(axis=1)
+
+        hit |= (near <= far) & (far >= tmin)
+
+    return hit
+
+class ShadowBackend(abc.ABC):
+    '''
+        Interface of the ray casting backends. Backends must implement occlusion
+    '''
+
+    '''
+        Keyword arguments accepted by the constructor of the backend (options of create_shadow_backend)
+    '''
+    OPTIONS = []
+
+    def __init__(self, coords, indices, normals, samples=None):
+        '''
+            * @param {np.ndarray} coords (n,3) vertices
+            * @param {np.ndarray} indices (m,3) triangles
+            * @param {np.ndarray} normals (n,3) normal of each vertex
+            * @param {Tuple[np.ndarray]} samples (points, normals) the rays are cast from instead of the vertices. None casts one ray per vertex
+        '''
+
+        self.coords = coords
+        self.indices = indices
+
+        if(samples == None):
+            samples = (coords, normals)
+
+        # origin and normal of each ray
+        self.normals = np.asarray(samples[1], dtype=np.float64).reshape(-1, 3)
+        self.origins = np.asarray(samples[0], dtype=np.float64).reshape(-1, 3) + RAY_OFFSET * self.normals
+
+    @abc.abstractmethod
+    def occlusion(self, direction, vertices=None):
+        '''
+            * @param {List[float]} direction Unit vector pointing to the sun
+            * @param {np.ndarray} vertices Indices of the vertices (or samples) whose rays are cast. None casts all the rays
+            * @returns {np.ndarray} 1 for the vertices (or samples) in shadow, 0 otherwise (and for the rays not cast)
+        '''
+
+    def close(self):
+        pass
+
+class OptixShadowBackend(ShadowBackend):
+    '''
+        Casts the rays on the GPU with plotoptix (requires an NVIDIA GPU)
+    '''
+
+    def __init__(self, coords, indices, normals, samples=None):
+
+        if(NpOptiX == None):
+            raise Exception("plotoptix is not available")
+
+        super().__init__(coords, indices, normals, samples)
+
+        self.done = threading.Event()
+
+        def done(rt: NpOptiX) -> None:
+            self.done.set()
+
+        camera_plane_dim = math.ceil(math.sqrt(len(self.origins)))
+        width = camera_plane_dim # camera plane width
+        height = camera_plane_dim # camera plane height
+
+        rt = NpOptiX(width=width, height=height)
+        rt.set_mesh('buildings', pos=coords, faces=indices, normals=normals)#, c=colors)
+        rt.set_float("scene_epsilon", SCENE_EPSILON) # set shader variable with a given name
+        rt.set_param(min_accumulation_step=1, max_accumulation_frames=1) # set raytracer parameter(s)
+        rt.set_accum_done_cb(done)
+        rt.start()
+
+        self.rt = rt
+
+        # ray origins do not depend on the direction, so the eye texture is built and uploaded to the GPU once. Unused texels are left at zero
+        self.count = len(self.origins)
+        self.size = math.ceil(math.sqrt(self.count))
+
+        eye = np.zeros((self.size*self.size, 4), dtype=np.float32)
+        eye[:self.count, :3] = self.origins
+
+        self.eye = eye.reshape(self.size, self.size, 4)
+
+        rt.set_texture_2d('eye', self.eye)
+
+    def occlusion(self, direction, vertices=None):
+
+        rt = self.rt
+
+        # only the directions change between sun positions. Back-facing vertices keep a zero direction
+        rdir = np.zeros((self.size*self.size, 4), dtype=np.float32)
+        rdir[:self.count][traced_vertices(self.normals, direction, vertices)] = [direction[0], direction[1], direction[2], -1]
+
+        rt.set_texture_2d('dir', rdir.reshape(self.size, self.size, 4), refresh=True)
+
+        self.done.clear() # resetting the thread flag
+        rt.setup_camera('cam2', cam_type='CustomProjXYZtoDir', textures=['eye', 'dir'], make_current=True) # two 4D textures are defined ([height, width, 4]). 'eye' is composed of origin points ([x, y, z, 0]). 'dir' is composed of ray directions and maximum ranges ([cosx, cosy, cosz, r]).
+
+        self.done.wait() # wait for the ray tracer to finish
+
+        dist = rt._hit_pos[:,:,3].reshape(-1) # _hit_pos shape: (height, width, 4). This 4 refers to [X, Y, Z, D], where XYZ is the hit 3D position and D is the hit distance to the camera plane. We are only interested in the D.
+        dist = np.array(dist[:self.count]) # dropping extra points in the end of the matrix
+
+        dist[dist < 0xFFFFFFFF] = 1
+        dist[dist > 0xFFFFFFFF] = 0
+
+        return dist
+
+    def close(self):
+        pass # rt.close()
+
+def _part1by2(x):
+    '''
+        Spreads the 10 lower bits of x so there are two zero bits between each of them
+    '''
+
+    x = x.astype(np.uint64) & 0x3FF
+    x = (x | (x << 16)) & 0x030000FF
+    x = (x | (x << 8)) & 0x0300F00F
+    x = (x | (x << 4)) & 0x030C30C3
+    x = (x | (x << 2)) & 0x09249249
+
+    return x
+
+def morton_codes(points):
+    '''
+        30 bits Morton code of each point quantized inside the bounding box of all points
+    '''
+
+    mins = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - mins, 1e-12)
+
+    quantized = np.clip(((points - mins) / extent * 1023), 0, 1023).astype(np.uint64)
+
+    return (_part1by2(quantized[:,0]) << 2) | (_part1by2(quantized[:,1]) << 1) | _part1by2(quantized[:,2])
+
+class TriangleBVH:
+    '''
+        Linear BVH over a triangle soup built with NumPy.
+
+        Triangles are sorted along a Morton curve and grouped in leaves of leaf_size consecutive triangles. The tree is complete
+        (the number of leaves is padded to a power of two), so level l has 2^l nodes and the children of node i are 2i and 2i+1.
+        Rays are traversed in batches: all (ray, node) pairs of a level are tested against the node boxes at once.
+    '''
+
+    def __init__(self, coords, indices, leaf_size=8):
+        '''
+            * @param {np.ndarray} coords (n,3) vertices
+            * @param {np.ndarray} indices (m,3) triangles
+            * @param {int} leaf_size Triangles per leaf
+        '''
+
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+
+        v0 = coords[indices[:,0]]
+        v1 = coords[indices[:,1]]
+        v2 = coords[indices[:,2]]
+
+        if(len(indices) > 0):
+            order = np.argsort(morton_codes((v0+v1+v2)/3), kind='stable')
+            v0, v1, v2 = v0[order], v1[order], v2[order]
+
+        self.leaf_size = leaf_size
+        self.depth = max(math.ceil(math.log2(max(math.ceil(len(indices)/leaf_size), 1))), 0)
+
+        leaves = 1 << self.depth
+        padding = leaves*leaf_size - len(indices)
+
+        # padded triangles are degenerate (no area), so they are never hit
+        self.v0 = np.concatenate((v0, np.zeros((padding, 3))))
+        self.e1 = np.concatenate((v1 - v0, np.zeros((padding, 3))))
+        self.e2 = np.concatenate((v2 - v0, np.zeros((padding, 3))))
+
+        mins = np.concatenate((np.minimum(np.minimum(v0, v1), v2), np.full((padding, 3), np.inf)))
+        maxs = np.concatenate((np.maximum(np.maximum(v0, v1), v2), np.full((padding, 3), -np.inf)))
+
+        # boxes of each level, from the leaves to the root
+        self.mins = [mins.reshape(leaves, leaf_size, 3).min(axis=1)]
+        self.maxs = [maxs.reshape(leaves, leaf_size, 3).max(axis=1)]
+
+        for level in range(self.depth):
+            self.mins.insert(0, self.mins[0].reshape(-1, 2, 3).min(axis=1))
+            self.maxs.insert(0, self.maxs[0].reshape(-1, 2, 3).max(axis=1))
+
+        # nodes containing only padded triangles
+        self.valid = [np.all(mins <= maxs, axis=1) for mins, maxs in zip(self.mins, self.maxs)]
+
+    def _hits_boxes(self, level, nodes, origins, inverse, tmin):
+        '''
+            Slab test of each ray against the box of its node
+        '''
+
+        with np.errstate(invalid='ignore'):
+            t1 = (self.mins[level][nodes] - origins) * inverse
+            t2 = (self.maxs[level][nodes] - origins) * inverse
+
+        # nan appears when a ray parallel to a slab starts on its plane. Keep the node, the triangle test is exact
+        near = np.nan_to_num(np.minimum(t1, t2), nan=-np.inf, posinf=np.inf, neginf=-np.inf).max(axis=1)
+        far = np.nan_to_num(np.maximum(t1, t2), nan=np.inf, posinf=np.inf, neginf=-np.inf).min(axis=1)
+
+        return self.valid[level][nodes] & (near <= far) & (far >= tmin)
+
+    def _hits_triangles(self, triangles, origins, directions, tmin):
+        '''
+            Möller–Trumbore test of each ray against its triangle
+        '''
+
+        e1 = self.e1[triangles]
+        e2 = self.e2[triangles]
+
+        pvec = np.cross(directions, e2)
+        det = np.einsum('ij,ij->i', e1, pvec)
+
+        valid = np.abs(det) > 1e-12
+        inv_det = np.divide(1.0, det, out=np.zeros_like(det), where=valid)
+
+        tvec = origins - self.v0[triangles]
+        u = np.einsum('ij,ij->i', tvec, pvec) * inv_det
+
+        qvec = np.cross(tvec, e1)
+        v = np.einsum('ij,ij->i', directions, qvec) * inv_det
+        t = np.einsum('ij,ij->i', e2, qvec) * inv_det
+
+        return valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > tmin)
+
+    def occluded(self, origins, directions, tmin=SCENE_EPSILON, rays_per_batch=1<<14):
+        '''
+            True for the rays that hit any triangle farther than tmin from their origin
+
+            * @param {np.ndarray} origins (r,3) origin of each ray
+            * @param {np.ndarray} directions (r,3) direction of each ray
+            * @param {int} rays_per_batch Number of rays traversed at once (bounds the memory used by the traversal)
+        '''
+
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+
+        hit = np.zeros(len(origins), dtype=bool)
+
+        for start in range(0, len(origins), rays_per_batch):
+            hit[start:start+rays_per_batch] = self._occluded_batch(origins[start:start+rays_per_batch], directions[start:start+rays_per_batch], tmin)
+
+        return hit
+
+    def _occluded_batch(self, origins, directions, tmin, pairs_per_test=1<<18):
+
+        hit = np.zeros(len(origins), dtype=bool)
+
+        with np.errstate(divide='ignore'):
+            inverse = 1.0 / directions
+
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=np.int64)
+
+        for level in range(self.depth+1):
+            keep = self._hits_boxes(level, nodes, origins[rays], inverse[rays], tmin)
+            rays, nodes = rays[keep], nodes[keep]
+
+            if(level < self.depth):
+                rays = np.repeat(rays, 2)
+                nodes = np.repeat(nodes, 2)*2 + np.tile([0, 1], len(nodes))
+
+        # (ray, leaf) pairs are tested against the triangles of the leaf
+        step = max(pairs_per_test // self.leaf_size, 1)
+
+        for start in range(0, len(rays), step):
+            pending = ~hit[rays[start:start+step]] # rays already in shadow do not need more tests
+
+            pair_rays = rays[start:start+step][pending]
+            pair_nodes = nodes[start:start+step][pending]
+
+            triangle_rays = np.repeat(pair_rays, self.leaf_size)
+            triangles = (pair_nodes[:,None]*self.leaf_size + np.arange(self.leaf_size)).ravel()
+
+            hits = self._hits_triangles(triangles, origins[triangle_rays], directions[triangle_rays], tmin)
+            hit[triangle_rays[hits]] = True
+
+        return hit
+
+_worker_bvh = None
+
+def _init_worker(bvh):
+    global _worker_bvh
+    _worker_bvh = bvh
+
+def _occluded_chunk(origins, directions):
+    return _worker_bvh.occluded(origins, directions)
+
+class CPUShadowBackend(ShadowBackend):
+    '''
+        Casts the rays on the CPU against a TriangleBVH. Rays of each direction are split in chunks traced by a pool of processes
+    '''
+
+    '''
+        Minimum number of rays per chunk sent to a worker
+    '''
+    MIN_CHUNK_SIZE = 1 << 12
+
+    OPTIONS = ['workers']
+
+    def __init__(self, coords, indices, normals, samples=None, workers=None):
+        '''
+            * @param {int} workers Number of processes. If None the number of CPUs is used. With 1 the rays are traced in this process
+        '''
+
+        super().__init__(coords, indices, normals, samples)
+
+        self.bvh = TriangleBVH(coords, indices)
+
+        self.workers = os.cpu_count() if workers == None else workers
+        self.executor = None
+
+    def occlusion(self, direction, vertices=None):
+
+        direction = np.asarray(direction, dtype=np.float64)
+
+        active = np.nonzero(traced_vertices(self.normals, direction, vertices))[0]
+        origins = self.origins[active]
+        directions = np.broadcast_to(direction, origins.shape)
+
+        chunks = max(min(self.workers, len(active) // self.MIN_CHUNK_SIZE), 1)
+
+        if(chunks == 1):
+            hit = self.bvh.occluded(origins, directions)
+        else:
+            if(self.executor == None):
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.bvh,))
+
+            bounds = np.linspace(0, len(active), chunks+1).astype(np.int64)
+            results = self.executor.map(_occluded_chunk, [origins[start:end] for start, end in zip(bounds[:-1], bounds[1:])], [directions[start:end] for start, end in zip(bounds[:-1], bounds[1:])])
+            hit = np.concatenate(list(results))
+
+        occlusion = np.zeros(len(self.origins))
+        occlusion[active[hit]] = 1
+
+        return occlusion
+
+    def close(self):
+        if(self.executor != None):
+            self.executor.shutdown()
+            self.executor = None
+
+def _cross2(a, b):
+    return a[:,0]*b[:,1] - a[:,1]*b[:,0]
+
+def rasterize_depth(points, depth, triangles, shape, pixels_per_batch=1<<22):
+    '''
+        Depth map keeping the largest depth of the triangles covering the center of each pixel (-inf where nothing is drawn)
+
+        Each triangle is tested against the pixels of its bounding box, so the cost is proportional to the covered pixels.
+
+        * @param {np.ndarray} points (n,2) vertices in pixel units
+        * @param {np.ndarray} depth (n) depth of each vertex
+        * @param {np.ndarray} triangles (m,3) triangles
+        * @param {Tuple[int]} shape (height, width) of the map
+        * @param {int} pixels_per_batch Maximum number of (triangle, pixel) pairs tested at once
+    '''
+
+    height, width = shape
+    depthmap = np.full(height*width, -np.inf)
+
+    p0 = points[triangles[:,0]]
+    p1 = points[triangles[:,1]]
+    p2 = points[triangles[:,2]]
+
+    area = _cross2(p1-p0, p2-p0)
+
+    # triangles seen edge-on do not cover any pixel
+    visible = np.abs(area) > 1e-12
+    triangles, p0, p1, p2, area = triangles[visible], p0[visible], p1[visible], p2[visible], area[visible]
+
+    # pixels whose center (i+0.5) is inside the bounding box of each triangle
+    lower = np.clip(np.ceil(np.minimum(np.minimum(p0, p1), p2) - 0.5), 0, [width, height]).astype(np.int64)
+    upper = np.clip(np.floor(np.maximum(np.maximum(p0, p1), p2) - 0.5) + 1, 0, [width, height]).astype(np.int64)
+
+    spans = np.maximum(upper - lower, 0)
+    counts = spans[:,0]*spans[:,1]
+
+    # barycentric coordinates (w0, w1) and depth are affine functions of the pixel center: a*x + b*y + c
+    d0, d1, d2 = depth[triangles[:,0]], depth[triangles[:,1]], depth[triangles[:,2]]
+
+    w0 = np.stack((p1[:,1]-p2[:,1], p2[:,0]-p1[:,0], _cross2(p1, p2)), axis=1) / area[:,None]
+    w1 = np.stack((p2[:,1]-p0[:,1], p0[:,0]-p2[:,0], _cross2(p2, p0)), axis=1) / area[:,None]
+    z = w0*(d0-d2)[:,None] + w1*(d1-d2)[:,None]
+    z[:,2] += d2
+
+    # one row per coefficient, so each one is gathered from contiguous memory
+    c = np.ascontiguousarray(np.concatenate((w0, w1, z), axis=1).T)
+
+    ends = np.cumsum(counts)
+    start = 0
+
+    while(start < len(triangles)):
+        end = max(int(np.searchsorted(ends, ends[start] - counts[start] + pixels_per_batch, side='right')), start+1)
+
+        batch_counts = counts[start:end]
+
+        # triangle of each (triangle, pixel) pair and position of the pixel in the bounding box of the triangle
+        tri = np.repeat(np.arange(start, end), batch_counts)
+        local = np.arange(len(tri)) - (ends[tri] - counts[tri])
+        span = spans[tri,0]
+
+        px = lower[tri,0] + local % span
+        py = lower[tri,1] + local // span
+
+        x = px + 0.5
+        y = py + 0.5
+
+        b0 = c[0][tri]*x + c[1][tri]*y + c[2][tri]
+        b1 = c[3][tri]*x + c[4][tri]*y + c[5][tri]
+
+        inside = (b0 >= -1e-9) & (b1 >= -1e-9) & (b0 + b1 <= 1 + 1e-9)
+
+        tri, x, y = tri[inside], x[inside], y[inside]
+
+        cell = py[inside]*width + px[inside]
+        z = c[6][tri]*x + c[7][tri]*y + c[8][tri]
+
+        # largest depth per pixel: the pairs are sorted by pixel and reduced per run of equal pixels (np.maximum.at is unbuffered and slow)
+        if(len(cell) > 0):
+            order = np.argsort(cell, kind='stable')
+            cell = cell[order]
+
+            first = np.concatenate(([0], np.nonzero(cell[1:] != cell[:-1])[0] + 1))
+            pixels = cell[first]
+
+            depthmap[pixels] = np.maximum(depthmap[pixels], np.maximum.reduceat(z[order], first))
+
+        start = end
+
+    return depthmap.reshape(height, width)
+
+class ShadowMapBackend(ShadowBackend):
+    '''
+        Approximate shadows with a shadow map: the mesh is rasterized with an orthographic projection along the sun direction and each
+        vertex is in shadow if the map has geometry closer to the sun than the vertex at its pixel. The cost depends on the resolution of
+        the map (pixels covered by the triangles) instead of rays x triangles.
+    '''
+
+    '''
+        Default side of a pixel of the map (meters)
+    '''
+    TEXEL_SIZE = 1.0
+
+    '''
+        Maximum number of pixels of the largest side of the map, so large scenes do not allocate huge maps
+    '''
+    MAX_RESOLUTION = 4096
+
+    '''
+        Largest slope (tangent of the angle between the normal and the sun direction) used in the bias of grazing surfaces
+    '''
+    MAX_BIAS_SLOPE = 8.0
+
+    OPTIONS = ['resolution', 'texel_size']
+
+    def __init__(self, coords, indices, normals, samples=None, resolution=None, texel_size=None):
+        '''
+            * @param {int} resolution Number of pixels of the largest side of the map. If None it is derived from the extent of the scene and texel_size
+            * @param {float} texel_size Side of a pixel of the map (meters). If None TEXEL_SIZE is used. Ignored if resolution is given
+        '''
+
+        super().__init__(coords, indices, normals, samples)
+
+        self.resolution = resolution
+        self.texel_size = self.TEXEL_SIZE if texel_size == None else texel_size
+
+        self.points = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+
+    def _basis(self, direction):
+        '''
+            Axes of the map (u, v) and depth axis (pointing to the sun)
+        '''
+
+        w = direction / np.linalg.norm(direction)
+        helper = np.array([0.0, 0.0, 1.0]) if abs(w[2]) < 0.9 else np.array([1.0, 0.0, 0.0])
+
+        u = np.cross(helper, w)
+        u = u / np.linalg.norm(u)
+        v = np.cross(w, u)
+
+        return np.stack((u, v)), w
+
+    def occlusion(self, direction, vertices=None):
+
+        direction = np.asarray(direction, dtype=np.float64)
+        occlusion = np.zeros(len(self.origins))
+
+        if(len(self.triangles) == 0):
+            return occlusion
+
+        axes, w = self._basis(direction)
+
+        projected = self.points @ axes.T
+        mins = projected.min(axis=0)
+        extent = (projected.max(axis=0) - mins).max()
+
+        if(self.resolution != None):
+            pixel = max(extent / self.resolution, 1e-9)
+        else:
+            pixel = max(self.texel_size, extent / self.MAX_RESOLUTION, 1e-9)
+
+        width, height = (np.floor((projected.max(axis=0) - mins) / pixel).astype(np.int64) + 1).tolist()
+
+        depthmap = rasterize_depth((projected - mins) / pixel, self.points @ w, self.triangles, (height, width))
+
+        # depth of the geometry in front of each vertex
+        cells = np.floor((self.origins @ axes.T - mins) / pixel).astype(np.int64)
+        inside = (cells[:,0] >= 0) & (cells[:,0] < width) & (cells[:,1] >= 0) & (cells[:,1] < height)
+
+        blocker = np.full(len(self.origins), -np.inf)
+        blocker[inside] = depthmap[cells[inside,1], cells[inside,0]]
+
+        # surfaces are sampled once per pixel, so the depth of a surface varies by pixel * tan(angle between its normal and the sun) inside
+        # a pixel. The bias follows that slope: small for surfaces facing the sun (no peter-panning) and large for grazing ones (no acne)
+        cosine = np.clip(self.normals @ w / np.maximum(np.linalg.norm(self.normals, axis=1), 1e-12), 1e-6, 1)
+        slope = np.minimum(np.sqrt(1 - cosine*cosine) / cosine, self.MAX_BIAS_SLOPE)
+
+        bias = SCENE_EPSILON + pixel * slope
+
+        shadowed = traced_vertices(self.normals, direction, vertices) & (blocker > self.origins @ w + bias)
+        occlusion[shadowed] = 1
+
+        return occlusion
+
+SHADOW_BACKENDS = {
+    'optix': OptixShadowBackend,
+    'cpu': CPUShadowBackend,
+    'shadowmap': ShadowMapBackend
+}
+
+def create_shadow_backend(coords, indices, normals, backend=None, options=None, samples=None):
+    '''
+        Creates a shadow backend for a mesh
+
+        * @param {Tuple[np.ndarray]} samples (points, normals) the rays are cast from instead of the vertices (e.g. one point per cell). None casts one ray per vertex
+        * @param {string} backend One of SHADOW_BACKENDS. If None OptiX is used when a GPU is available and the CPU backend otherwise
+        * @param {dict} options Keyword arguments of the backend (e.g. resolution for 'shadowmap' or workers for 'cpu'). Options of other backends are dropped with a warning and unknown options raise an exception
+    '''
+
+    if(options == None):
+        options = {}
+
+    if(backend != None and backend not in SHADOW_BACKENDS):
+        raise Exception("Unknown shadow backend "+str(backend)+". Options: "+", ".join(SHADOW_BACKENDS))
+
+    known = [option for backend_class in SHADOW_BACKENDS.values() for option in backend_class.OPTIONS]
+    unknown = [key for key in options if key not in known]
+
+    if(len(unknown) > 0):
+        raise Exception("Unknown shadow backend options: "+", ".join(unknown)+". Options: "+", ".join(known))
+
+    if(backend == None):
+        if(NpOptiX != None):
+            try:
+                return OptixShadowBackend(coords, indices, normals, samples, **_backend_options('optix', options))
+            except Exception as e:
+                warnings.warn("OptiX backend not available ("+str(e)+"). Using the CPU backend.")
+
+        backend = 'cpu'
+
+    return SHADOW_BACKENDS[backend](coords, indices, normals, samples, **_backend_options(backend, options))
+
+def _backend_options(backend, options):
+    '''
+        Options accepted by a backend. Options of other backends are dropped with a warning
+    '''
+
+    accepted = SHADOW_BACKENDS[backend].OPTIONS
+    dropped = [key for key in options if key not in accepted]
+
+    if(len(dropped) > 0):
+        warnings.warn("Options "+", ".join(dropped)+" are not used by the "+backend+" shadow backend and were ignored.")
+
+    return {key: value for key, value in options.items() if key in accepted}
@@ -0,0 +1,109 @@
+import numpy as np
+import pytz
+import threading
+import timezonefinder
+
+from functools import lru_cache
+
+'''
+    Vectorized position of the sun following the NOAA solar calculator equations
+    (https://gml.noaa.gov/grad/solcalc/calcdetails.html), with the refraction correction of the NREL SPA used by pysolar.
+
+    Altitudes and azimuths agree with pysolar.solar.get_altitude/get_azimuth within a few hundredths of a degree,
+    but a whole array of timestamps is computed at once.
+'''
+
+SUN_RADIUS = 0.26667 # degrees
+ATMOSPHERIC_REFRACTION = 0.5667 # degrees
+STANDARD_PRESSURE = 1013.25 # millibars
+STANDARD_TEMPERATURE = 15.0 # celsius
+
+_timezone_finder = None
+_timezone_finder_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def timezone_at(latitude, longitude):
+    '''
+        pytz timezone of a location. The TimezoneFinder (which loads its data when created) is shared by the threads of the process and the result is cached per location
+    '''
+
+    global _timezone_finder
+
+    with _timezone_finder_lock:
+        if(_timezone_finder == None):
+            _timezone_finder = timezonefinder.TimezoneFinder()
+
+        name = _timezone_finder.timezone_at(lng=longitude, lat=latitude)
+
+    return pytz.timezone(name)
+
+def solar_position(times, latitude, longitude, pressure=STANDARD_PRESSURE, temperature=STANDARD_TEMPERATURE):
+    '''
+        Altitude and azimuth of the sun
+
+        * @param {np.ndarray} times UTC timestamps (datetime64)
+        * @param {float} latitude Latitude in degrees
+        * @param {float} longitude Longitude in degrees (east positive)
+        * @param {float} pressure Atmospheric pressure in millibars used in the refraction correction
+        * @param {float} temperature Temperature in celsius used in the refraction correction
+        * @returns {Tuple[np.ndarray]} altitude (degrees above the horizon, corrected for refraction) and azimuth (degrees clockwise from north)
+    '''
+
+    seconds = (np.asarray(times, dtype='datetime64[ns]') - np.datetime64('1970-01-01T00:00:00', 'ns')) / np.timedelta64(1, 's')
+
+    julian_day = seconds / 86400.0 + 2440587.5
+    T = (julian_day - 2451545.0) / 36525.0 # julian century
+
+    mean_longitude = np.mod(280.46646 + T*(36000.76983 + T*0.0003032), 360)
+    mean_anomaly = np.radians(357.52911 + T*(35999.05029 - 0.0001537*T))
+    eccentricity = 0.016708634 - T*(0.000042037 + 0.0000001267*T)
+
+    center = np.sin(mean_anomaly)*(1.914602 - T*(0.004817 + 0.000014*T)) + np.sin(2*mean_anomaly)*(0.019993 - 0.000101*T) + np.sin(3*mean_anomaly)*0.000289
+
+    omega = np.radians(125.04 - 1934.136*T)
+    apparent_longitude = np.radians(mean_longitude + center - 0.00569 - 0.00478*np.sin(omega))
+
+    mean_obliquity = 23 + (26 + (21.448 - T*(46.815 + T*(0.00059 - T*0.001813)))/60)/60
+    obliquity = np.radians(mean_obliquity + 0.00256*np.cos(omega))
+
+    declination = np.arcsin(np.sin(obliquity)*np.sin(apparent_longitude))
+
+    y = np.tan(obliquity/2)**2
+    L0 = np.radians(mean_longitude)
+    equation_of_time = 4*np.degrees(y*np.sin(2*L0) - 2*eccentricity*np.sin(mean_anomaly) + 4*eccentricity*y*np.sin(mean_anomaly)*np.cos(2*L0) - 0.5*y*y*np.sin(4*L0) - 1.25*eccentricity*eccentricity*np.sin(2*mean_anomaly)) # minutes
+
+    true_solar_time = np.mod(np.mod(seconds, 86400.0)/60.0 + equation_of_time + 4*longitude, 1440) # minutes
+    hour_angle = np.radians(true_solar_time/4 - 180)
+
+    phi = np.radians(latitude)
+
+    cos_zenith = np.clip(np.sin(phi)*np.sin(declination) + np.cos(phi)*np.cos(declination)*np.cos(hour_angle), -1, 1)
+    zenith = np.arccos(cos_zenith)
+
+    # azimuth clockwise from north
+    azimuth = np.mod(np.degrees(np.arctan2(np.sin(hour_angle), np.cos(hour_angle)*np.sin(phi) - np.tan(declination)*np.cos(phi))) + 180, 360)
+
+    elevation = 90 - np.degrees(zenith)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        refraction = (pressure/1010.0) * (283.0/(273.0 + temperature)) * 1.02 / (60.0*np.tan(np.radians(elevation + 10.3/(elevation + 5.11))))
+
+    refraction = np.where(elevation >= -(SUN_RADIUS + ATMOSPHERIC_REFRACTION), refraction, 0.0)
+
+    return elevation + refraction, azimuth
+
+def sun_directions(altitude, azimuth):
+    '''
+        Unit vectors pointing to the sun (x east, y north, z up)
+
+        * @param {np.ndarray} altitude Degrees above the horizon
+        * @param {np.ndarray} azimuth Degrees clockwise from north
+        * @returns {np.ndarray} (n,3) array
+    '''
+
+    altitude = np.radians(np.asarray(altitude, dtype=np.float64))
+    azimuth = np.pi/2.0 - np.radians(np.asarray(azimuth, dtype=np.float64))
+
+    directions = np.stack((np.cos(altitude)*np.cos(azimuth), np.cos(altitude)*np.sin(azimuth), np.sin(altitude)), axis=-1)
+
+    return directions / np.linalg.norm(directions, axis=-1, keepdims=True)
@@ -2,11 +2,12 @@ import json
 import geopandas as gpd
 import pandas as pd
 import os
-import struct
 import webbrowser
 
 from shapely.geometry import Polygon, Point
 
+from .layer_io import *
+
 class UrbanComponent:
     """
     Basic Urban Toolkit component
@@ -112,42 +113,28 @@ class UrbanComponent:
 
         return {'objects': gdf, 'coordinates': gdf_coordinates, 'coordinates3d': df_coordinates3d}
 
-    def break_into_binary(self, filepath, filename, data, types, dataTypes):
-
-        transformed_data = data
-
-        for index, type in enumerate(types):
-
-            readCoords = 0
-
-            floatList = []
+    def break_into_binary(self, filepath, filename, data, types, dataTypes, compression=None, local_origin=False):
 
-            for i in range(len(transformed_data['data'])):
-                geometry = transformed_data['data'][i]['geometry']
+        header = write_sidecars(filepath, filename, data['data'], types, dataTypes, compression, local_origin)
 
-                newValue = [readCoords, len(geometry[type])] # where this vector starts and its size
+        for key in ['compression', 'origin']:
+            if(key in data):
+                del data[key]
 
-                readCoords += len(geometry[type])
+        data.update(header)
 
-                floatList += geometry[type].copy()
+        write_layer_json(os.path.join(filepath,filename+".json"), data)
 
-                # geometry[type] = newValue
+    def save(self, dir=None, includeGrammar=True, packed=False, compression=None, local_origin=False):
+        '''
+            Saves the layers (and the grammar) in dir or in the work directory.
 
-                transformed_data['data'][i]['geometry'][type] = newValue
+            If packed is True each physical layer is written as a single .utkpack file instead of a .json file plus the .data sidecars (a .json saved before for the layer and its sidecars are deleted)
 
-            fout = open(os.path.join(filepath,filename+'_'+type+'.data'), 'wb')
+            compression ('zlib' or 'lzma') stores the sidecars as chunked compressed .zdata files. It is ignored for packed layers
 
-            buf = struct.pack(str(len(floatList))+dataTypes[index], *floatList)
-
-            fout.write(buf)
-            fout.close()
-
-        json_object = json.dumps(transformed_data)
-
-        with open(os.path.join(filepath,filename+".json"), "w") as outfile:
-            outfile.write(json_object)
-
-    def save(self, dir=None, includeGrammar=True):
+            local_origin stores the origin of each layer (float64) in its header and the coordinates as float32 offsets from it
+        '''
 
         if(self.workDir == None and dir == None):
             raise Exception("Directory not specified")
@@ -250,7 +237,10 @@ class UrbanComponent:
                     types.append("ids")
                     dataTypes.append("I")
 
-                self.break_into_binary(workDir, layer['id'], layer, types, dataTypes)
+                if(packed):
+                    write_packed_layer(workDir, layer, types, dataTypes, local_origin)
+                else:
+                    self.break_into_binary(workDir, layer['id'], layer, types, dataTypes, compression, local_origin)
 
         if(includeGrammar):
             grammar_json_str = str(json.dumps(grammar_json, indent=4))
@@ -11,21 +11,13 @@ import warnings
 from shapely.errors import ShapelyDeprecationWarning
 warnings.filterwarnings("ignore", category=ShapelyDeprecationWarning) 
 
-def remove_elements(filepath, ids):
-    file = open(filepath, mode='r')
-    file_content = json.loads(file.read())
-
-    new_data_array = []
-
-    for index,data in enumerate(file_content['data']):
-        if(index not in ids):
-            new_data_array.append(data)
+'''
+    Removes features (by index) from a saved physical layer, updating its json and its binary sidecars. Ids that are not in the layer are ignored
 
-    file_content['data'] = new_data_array
-
-    with open(filepath, "w") as outfile:
-        json.dump(file_content, outfile)
-
-    file.close()
+    To delete features in several steps without rewriting the layer each time use delete_features and then compact_layer
+'''
+def remove_elements(filepath, ids):
+    delete_features(filepath, ids, ignore_missing=True)
+    compact_layer(filepath)
 
 
@@ -0,0 +1,251 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from datetime import datetime
+
+from .solar_position import timezone_at
+from .layer_io import BBOX_TYPE, bbox_path
+
+'''
+    Shadow of every vertex for every sun position of a shadow run, stored as a bitset: one row of np.packbits per timestamp.
+    The bits are memory-mapped from <name>_visibility.data and described by <name>.json (vertices, UTC timestamps and location),
+    so any time window can be aggregated again without ray tracing. Rows of adaptive runs (ShadowAccumulator(angular_tolerance=...))
+    stand for segments of different durations, which are stored in the header and weight the rows when they are aggregated.
+
+    The bounding box and number of vertices of every feature of the run are stored in <name>_bbox.data and <name>_sizes.data, so an
+    incremental run (ShadowAccumulator.accumulate_shadow(previous=...)) knows where the edited geometry was.
+'''
+
+VISIBILITY_ELEMENT = 'visibility'
+SIZES_ELEMENT = 'sizes'
+SIZES_TYPE = 'I'
+
+'''
+    Number of timestamps unpacked at once when aggregating
+'''
+UNPACK_ROWS = 256
+
+def visibility_path(filepath):
+    return os.path.splitext(filepath)[0]+'_'+VISIBILITY_ELEMENT+'.data'
+
+def sizes_path(filepath):
+    return os.path.splitext(filepath)[0]+'_'+SIZES_ELEMENT+'.data'
+
+def _feature_table_path(filepath):
+    return bbox_path(os.path.dirname(filepath), os.path.splitext(os.path.basename(filepath))[0])
+
+class VisibilityCube:
+    '''
+        (timestamps, vertices) bitset of the vertices in shadow. Bit 1 means shadow
+    '''
+
+    def __init__(self, filepath, header, bits):
+        self.filepath = filepath
+        self.header = header
+        self.bits = bits
+
+        self.vertices = header['vertices']
+        self.times = np.array(header['times'], dtype='datetime64[s]')
+        self.latitude = header['latitude']
+        self.longitude = header['longitude']
+        self.durations = np.array(header['durations'], dtype=np.float64) if header.get('durations', None) != None else None
+
+    @staticmethod
+    def create(filepath, times, vertices, latitude, longitude, layers=[], coordinates_per_layer=[], bboxes=None, feature_sizes=None, features_per_layer=[], durations=None):
+        '''
+            Creates an empty cube (no vertex in shadow) to be filled row by row with write
+
+            * @param {string} filepath Path of the .json header. The bits are stored next to it
+            * @param {np.ndarray} times UTC timestamps (datetime64) of the rows
+            * @param {int} vertices Number of vertices of each row
+            * @param {float} latitude Latitude of the scene (used to convert local times)
+            * @param {float} longitude Longitude of the scene
+            * @param {List[string]} layers Layers whose vertices compose each row (in order)
+            * @param {List[int]} coordinates_per_layer Number of vertices of each layer
+            * @param {np.ndarray} bboxes (features,6) bounding box of each feature of the layers. None to skip the feature table
+            * @param {np.ndarray} feature_sizes Number of vertices of each feature of the layers
+            * @param {List[int]} features_per_layer Number of features of each layer
+            * @param {np.ndarray} durations Duration of each row in steps of the run (adaptive runs). None if every row is one step
+            * @returns {VisibilityCube}
+        '''
+
+        times = np.asarray(times, dtype='datetime64[s]')
+
+        header = {
+            'id': os.path.splitext(os.path.basename(filepath))[0],
+            'vertices': int(vertices),
+            'times': np.datetime_as_string(times, unit='s').tolist(),
+            'latitude': float(latitude),
+            'longitude': float(longitude),
+            'layers': list(layers),
+            'coordinates_per_layer': [int(count) for count in coordinates_per_layer],
+            'features_per_layer': [int(count) for count in features_per_layer]
+        }
+
+        if(durations is not None):
+            header['durations'] = np.asarray(durations, dtype=np.float64).tolist()
+
+        if(bboxes is not None):
+            np.asarray(bboxes, dtype=BBOX_TYPE).reshape(-1, 6).tofile(_feature_table_path(filepath))
+            np.asarray(feature_sizes, dtype=SIZES_TYPE).tofile(sizes_path(filepath))
+
+        with open(filepath, "w") as outfile:
+            json.dump(header, outfile)
+
+        shape = (len(times), (int(vertices)+7)//8)
+
+        if(shape[0] * shape[1] == 0):
+            open(visibility_path(filepath), 'wb').close()
+            bits = np.zeros(shape, dtype=np.uint8)
+        else:
+            bits = np.memmap(visibility_path(filepath), dtype=np.uint8, mode='w+', shape=shape)
+
+        return VisibilityCube(filepath, header, bits)
+
+    @staticmethod
+    def open(filepath, mode='r'):
+        '''
+            Memory-maps the cube stored by a previous run
+
+            * @param {string} filepath Path of the .json header
+            * @param {string} mode 'r' (read only) or 'r+' (rows can be written)
+            * @returns {VisibilityCube}
+        '''
+
+        with open(filepath, "r") as infile:
+            header = json.load(infile)
+
+        shape = (len(header['times']), (header['vertices']+7)//8)
+
+        if(shape[0] * shape[1] == 0):
+            bits = np.zeros(shape, dtype=np.uint8)
+        else:
+            bits = np.memmap(visibility_path(filepath), dtype=np.uint8, mode=mode, shape=shape)
+
+        return VisibilityCube(filepath, header, bits)
+
+    def layer_offsets(self):
+        '''
+            First vertex, number of vertices, first feature and number of features of each layer of the run (keyed by absolute path)
+        '''
+
+        layers = {}
+
+        vertex = 0
+        feature = 0
+
+        coordinates = self.header['coordinates_per_layer']
+        features = self.header.get('features_per_layer', [])
+
+        for index, layer in enumerate(self.header['layers']):
+            count = features[index] if index < len(features) else 0
+            layers[os.path.abspath(layer)] = (vertex, coordinates[index], feature, count)
+
+            vertex += coordinates[index]
+            feature += count
+
+        return layers
+
+    def feature_table(self):
+        '''
+            (bboxes, sizes) of the features of the run. None if the cube was stored without them
+        '''
+
+        if(not os.path.exists(sizes_path(self.filepath))):
+            return None
+
+        bboxes = np.fromfile(_feature_table_path(self.filepath), dtype=BBOX_TYPE).reshape(-1, 6)
+        sizes = np.fromfile(sizes_path(self.filepath), dtype=SIZES_TYPE).astype(np.int64)
+
+        return bboxes, sizes
+
+    def row(self, index):
+        '''
+            1 for the vertices in shadow at the timestamp index, 0 otherwise
+        '''
+        return np.unpackbits(self.bits[index], count=self.vertices)
+
+    def write(self, row, hits):
+        '''
+            * @param {int} row Index of the timestamp
+            * @param {np.ndarray} hits 1 for the vertices in shadow, 0 otherwise
+        '''
+        self.bits[row] = np.packbits(np.asarray(hits, dtype=bool))
+
+    def flush(self):
+        if(isinstance(self.bits, np.memmap)):
+            self.bits.flush()
+
+    def local_times(self):
+        '''
+            Timestamps in the local time of the scene (pandas DatetimeIndex)
+        '''
+        return pd.DatetimeIndex(self.times).tz_localize('UTC').tz_convert(timezone_at(self.latitude, self.longitude).zone)
+
+    def window(self, start=None, end=None, hours=None):
+        '''
+            Rows inside a time window
+
+            * @param {string} start Local timestamp (inclusive). Format: "%m/%d/%Y %H:%M". None for no lower bound
+            * @param {string} end Local timestamp (inclusive). Format: "%m/%d/%Y %H:%M". None for no upper bound
+            * @param {List[int]} hours Local hours of the day to keep (e.g. range(12, 15) for the peak hours). None keeps every hour
+            * @returns {np.ndarray} Boolean mask of the rows
+        '''
+
+        mask = np.ones(len(self.times), dtype=bool)
+
+        if(start == None and end == None and hours == None):
+            return mask
+
+        tz = timezone_at(self.latitude, self.longitude)
+
+        if(start != None):
+            mask &= self.times >= np.datetime64(_to_utc(tz, start), 's')
+
+        if(end != None):
+            mask &= self.times <= np.datetime64(_to_utc(tz, end), 's')
+
+        if(hours != None):
+            mask &= np.isin(self.local_times().hour, list(hours))
+
+        return mask
+
+    def accumulate(self, start=None, end=None, hours=None, weights=None):
+        '''
+            Shadow accumulated by each vertex over a time window
+
+            * @param {string} start Local timestamp (inclusive). Format: "%m/%d/%Y %H:%M"
+            * @param {string} end Local timestamp (inclusive). Format: "%m/%d/%Y %H:%M"
+            * @param {List[int]} hours Local hours of the day to consider
+            * @param {np.ndarray} weights Weight of each timestamp of the cube (e.g. irradiance). None counts the timestamps in shadow (weighted by their durations in adaptive runs)
+            * @returns {np.ndarray} Accumulation per vertex
+        '''
+
+        rows = np.nonzero(self.window(start, end, hours))[0]
+
+        if(weights is None and self.durations is not None):
+            weights = self.durations
+
+        if(weights is None):
+            accumulation = np.zeros(self.vertices, dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            accumulation = np.zeros(self.vertices, dtype=np.float64)
+
+        for block in range(0, len(rows), UNPACK_ROWS):
+            block_rows = rows[block:block+UNPACK_ROWS]
+            shadow = np.unpackbits(self.bits[block_rows], axis=1, count=self.vertices)
+
+            if(weights is None):
+                accumulation += shadow.sum(axis=0, dtype=np.int64)
+            else:
+                accumulation += weights[block_rows] @ shadow
+
+        return accumulation
+
+def _to_utc(tz, timestamp):
+    return tz.localize(datetime.strptime(timestamp, "%m/%d/%Y %H:%M")).astimezone(pytz.utc).replace(tzinfo=None)
@@ -6,6 +6,7 @@ import sys
 import time
 import argparse
 import json
+import numpy as np
 import psutil
 import threading
 import requests, zipfile, io
@@ -16,6 +17,8 @@ from watchdog.events import LoggingEventHandler
 
 from utk.utils import *
 from utk.files_interface import *
+from utk.layer_io import is_packed
+from utk.layer_view import open_layer
 
 app = Flask(__name__)
 geolocator = Nominatim(user_agent="urbantk")
@@ -154,7 +157,14 @@ def serve_getLayer():
 
     layer_json = {}
 
-    with open(os.path.join(workdir,layer+".json"), "r", encoding="utf-8") as f:
+    filepath = os.path.join(workdir,layer+".json")
+
+    if(is_packed(filepath)): # packed layers have no json: the geometry is returned inline
+        layer_json = open_layer(filepath).to_json()
+        layer_json.pop('origin', None) # the coordinates are returned absolute
+        return json.dumps(layer_json, indent=4, default=lambda values: np.asarray(values).tolist())
+
+    with open(filepath, "r", encoding="utf-8") as f:
         layer_json = json.load(f)
 
     return json.dumps(layer_json, indent=4)